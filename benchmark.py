@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+# Colobot Model Converter benchmark
+# Measures read and write speed and peak memory of every registered format
+
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import geometry
+import modelformats
+
+# put libraries with model format implementations here
+import modelformats.defaultmodel
+import modelformats.obj
+import modelformats.colobot
+import modelformats.colobotold
+import modelformats.collada
+
+
+def make_model(triangle_count: int, material_count: int, sharing: float, seed: int) -> geometry.ArrayModel:
+    """Generates random model
+
+    sharing is fraction of triangle corners that reuse vertex of other
+    corner, 0 means all vertices are unique.
+    """
+    rnd = random.Random(seed)
+    model = geometry.ArrayModel()
+
+    for i in range(material_count):
+        material = geometry.Material()
+        material.texture1 = f'texture{i:03d}.png'
+        material.state = rnd.choice((0, 1, 2, 4096, 8192))
+        material.diffuse = [round(rnd.random(), 3) for _ in range(3)] + [0.0]
+        model.add_material(material)
+
+    vertex_count = max(3, round(3 * triangle_count * (1.0 - sharing)))
+    vertices = []
+
+    for i in range(vertex_count):
+        vertices.append((
+            [round(rnd.uniform(-100.0, 100.0), 4) for _ in range(3)],
+            [round(rnd.uniform(-1.0, 1.0), 4) for _ in range(3)],
+            [round(rnd.random(), 4) for _ in range(2)],
+        ))
+
+    for i in range(3 * triangle_count):
+        # first corners use every vertex once, the rest are shared
+        if i < vertex_count:
+            coord, normal, tex1 = vertices[i]
+        else:
+            coord, normal, tex1 = vertices[rnd.randrange(vertex_count)]
+
+        model.positions.extend(coord)
+        model.normals.extend(normal)
+        model.tex1.extend(tex1)
+        model.tex2.extend((0.0, 0.0))
+
+    model.material_indices.extend(rnd.randrange(material_count) for _ in range(triangle_count))
+
+    return model
+
+
+# measures best time of repeated calls and peak traced memory of one call
+def measure(function, repeat: int) -> dict:
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = function()
+        elapsed = time.perf_counter() - start
+
+        if not completed:
+            return None
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'time': best, 'peak_memory': peak}
+
+
+def run(settings: dict, format_names: list[str]) -> dict:
+    model = make_model(settings['triangles'], settings['materials'], settings['sharing'], settings['seed'])
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in format_names:
+            fmt = modelformats.get_format(name)
+            filename = os.path.join(directory, f'{name}.{fmt.get_extension() or name}')
+
+            def write() -> bool:
+                return modelformats.write(name, filename, model, {})
+
+            def read() -> bool:
+                return modelformats.read(name, filename, modelformats.new_model(name, filename), {})
+
+            result = {}
+
+            result['write'] = measure(write, settings['repeat'])
+
+            if result['write'] is not None:
+                result['write']['bytes'] = os.path.getsize(filename)
+                result['read'] = measure(read, settings['repeat'])
+            else:
+                result['read'] = None
+
+            results[name] = result
+            print_result(name, result)
+
+    return results
+
+
+def print_result(name: str, result: dict) -> None:
+    for operation in ('read', 'write'):
+        values = result[operation]
+
+        if values is None:
+            print('{:<12}{:<8}{:>12}'.format(name, operation, 'skipped'))
+        else:
+            print('{:<12}{:<8}{:>10.3f} s{:>12.1f} MiB'.format(
+                name, operation, values['time'], values['peak_memory'] / (1024 * 1024)))
+
+
+# compares results with baseline, returns list of regression descriptions
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+
+    for name, result in results.items():
+        for operation, values in result.items():
+            base_values = baseline.get(name, {}).get(operation)
+
+            if values is None or base_values is None:
+                continue
+
+            for metric in ('time', 'peak_memory'):
+                if base_values[metric] <= 0:
+                    continue
+
+                ratio = values[metric] / base_values[metric]
+
+                if ratio > 1.0 + threshold:
+                    regressions.append(f'{name} {operation} {metric}: {ratio:.2f}x baseline')
+
+    return regressions
+
+
+def main() -> None:
+    settings = {
+        'triangles': 20000,
+        'materials': 8,
+        'sharing': 0.5,
+        'seed': 1,
+        'repeat': 3,
+    }
+
+    output_filename = None
+    baseline_filename = None
+    threshold = 0.1
+    format_names = None
+
+    # parse arguments
+    i = 1
+    n = len(sys.argv)
+
+    while i < n:
+        arg = sys.argv[i]
+
+        if arg == '-n':
+            settings['triangles'] = int(sys.argv[i+1])
+            i += 2
+        elif arg == '-m':
+            settings['materials'] = int(sys.argv[i+1])
+            i += 2
+        elif arg == '-sharing':
+            settings['sharing'] = float(sys.argv[i+1])
+            i += 2
+        elif arg == '-seed':
+            settings['seed'] = int(sys.argv[i+1])
+            i += 2
+        elif arg == '-repeat':
+            settings['repeat'] = int(sys.argv[i+1])
+            i += 2
+        elif arg == '-formats':
+            format_names = modelformats.get_format_list(sys.argv[i+1])
+            i += 2
+        elif arg == '-o':
+            output_filename = sys.argv[i+1]
+            i += 2
+        elif arg == '-baseline':
+            baseline_filename = sys.argv[i+1]
+            i += 2
+        elif arg == '-threshold':
+            threshold = float(sys.argv[i+1])
+            i += 2
+        else:
+            print('Unknown switch: {}'.format(arg))
+            exit()
+
+    if format_names is None:
+        # every format implementation once, default format depends on extension
+        format_names = []
+        seen = set()
+
+        for name, fmt in modelformats.formats.items():
+            if name != 'default' and type(fmt) not in seen:
+                seen.add(type(fmt))
+                format_names.append(name)
+
+    results = run(settings, format_names)
+
+    report = {
+        'settings': settings,
+        'python': platform.python_version(),
+        'converter': modelformats.version,
+        'results': results,
+    }
+
+    if output_filename is not None:
+        with open(output_filename, 'w', encoding='utf8') as output_file:
+            json.dump(report, output_file, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+    if baseline_filename is not None:
+        with open(baseline_filename, 'r', encoding='utf8') as input_file:
+            baseline = json.load(input_file)
+
+        if baseline['settings'] != settings:
+            print('Warning: baseline was made with different settings')
+
+        regressions = compare(results, baseline['results'], threshold)
+
+        for regression in regressions:
+            print(f'Regression: {regression}')
+
+        if len(regressions) > 0:
+            sys.exit(1)
+
+        print('No regressions.')
+
+
+if __name__ == '__main__':
+    main()
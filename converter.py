@@ -1,103 +1,182 @@
 # -*- coding: utf-8 -*-
 # Colobot Model Converter
-# Version 1.6
+# Version 1.7
 # Copyright (c) 2014 Tomasz Kapuściński
 
+import cProfile
 import sys
 
 import modelformats
+import profiling
 
 # put libraries with model format implementations here
 import modelformats.defaultmodel
 import modelformats.obj
 import modelformats.colobot
 import modelformats.colobotold
-
-# parse arguments
-i = 1
-n = len(sys.argv)
-
-batch_mode = False
-file_list = []
-
-in_filename = None
-in_format = 'default'
-in_params = {}
-
-out_filename = None
-out_format = 'default'
-out_params = {}
-
-while i < n:
-    arg = sys.argv[i]
-
-    if arg == '-i':
-        in_filename = sys.argv[i+1]
-        i += 2
-    elif arg == '-if':
-        in_format = sys.argv[i+1]
-        i += 2
-    elif arg == '-id':
-        in_params['directory'] = sys.argv[i+1]
-        i += 2
-    elif arg == '-ip':
-        text = sys.argv[i+1]
-
-        if '=' in text:
-            pair = text.split('=')
-            in_params[pair[0]] = pair[1]
-        else:
-            in_params[text] = 'none'
-
-        i += 2
-    elif arg == '-o':
-        out_filename = sys.argv[i+1]
-        i += 2
-    elif arg == '-of':
-        out_format = sys.argv[i+1]
-        i += 2
-    elif arg == '-od':
-        out_params['directory'] = sys.argv[i+1]
-        i += 2
-    elif arg == '-op':
-        text = sys.argv[i+1]
-
-        if '=' in text:
-            pair = text.split('=')
-            out_params[pair[0]] = pair[1]
+import modelformats.collada
+import modelformats.transcode
+
+def main() -> None:
+    # parse arguments
+    i = 1
+    n = len(sys.argv)
+
+    batch_mode = False
+    file_list = []
+    workers = 1
+    pipelined = False
+    manifest_filename = None
+    cache_directory = None
+    cache_size = 1024
+    profile = False
+    profile_filename = None
+    cprofile_filename = None
+
+    in_filename = None
+    in_format = 'default'
+    in_params = {}
+
+    out_filename = None
+    out_format = 'default'
+    out_params = {}
+
+    while i < n:
+        arg = sys.argv[i]
+
+        if arg == '-i':
+            in_filename = sys.argv[i+1]
+            i += 2
+        elif arg == '-if':
+            in_format = sys.argv[i+1]
+            i += 2
+        elif arg == '-id':
+            in_params['directory'] = sys.argv[i+1]
+            i += 2
+        elif arg == '-ip':
+            text = sys.argv[i+1]
+
+            if '=' in text:
+                pair = text.split('=')
+                in_params[pair[0]] = pair[1]
+            else:
+                in_params[text] = 'none'
+
+            i += 2
+        elif arg == '-o':
+            out_filename = sys.argv[i+1]
+            i += 2
+        elif arg == '-of':
+            out_format = sys.argv[i+1]
+            i += 2
+        elif arg == '-od':
+            out_params['directory'] = sys.argv[i+1]
+            i += 2
+        elif arg == '-op':
+            text = sys.argv[i+1]
+
+            if '=' in text:
+                pair = text.split('=')
+                out_params[pair[0]] = pair[1]
+            else:
+                out_params[text] = 'none'
+
+            i += 2
+        elif arg == '-batch':
+            batch_mode = True
+            i += 1
+        elif arg == '-add':
+            file_list.append(sys.argv[i+1])
+            i += 2
+        elif arg == '-addlist':
+            listfile = open(sys.argv[i+1], 'r', encoding='utf8')
+
+            for line in listfile.readlines():
+                if len(line) == 0:
+                    continue
+                if line[-1] == '\n':
+                    line = line[:-1]
+                file_list.append(line)
+
+            listfile.close()
+            i += 2
+        elif arg == '-j':
+            workers = modelformats.get_worker_count(sys.argv[i+1])
+
+            if workers is None:
+                sys.exit(1)
+
+            i += 2
+        elif arg == '-pipeline':
+            pipelined = True
+            i += 1
+        elif arg == '-manifest':
+            manifest_filename = sys.argv[i+1]
+            i += 2
+        elif arg == '-cache':
+            cache_directory = sys.argv[i+1]
+            i += 2
+        elif arg == '-cachesize':
+            cache_size = int(sys.argv[i+1])
+            i += 2
+        elif arg == '-profile' or arg == '--profile':
+            profile = True
+            i += 1
+        elif arg == '-profilejson':
+            profile = True
+            profile_filename = sys.argv[i+1]
+            i += 2
+        elif arg == '-cprofile':
+            profile = True
+            cprofile_filename = sys.argv[i+1]
+            i += 2
+        elif arg == '-f':
+            modelformats.print_formats()
+            exit()
+        elif arg == '-ext':
+            modelformats.print_extensions()
+            exit()
         else:
-            out_params[text] = 'none'
-
-        i += 2
-    elif arg == '-batch':
-        batch_mode = True
-        i += 1
-    elif arg == '-add':
-        file_list.append(sys.argv[i+1])
-        i += 2
-    elif arg == '-addlist':
-        listfile = open(sys.argv[i+1], 'r', encoding='utf8')
-
-        for line in listfile.readlines():
-            if len(line) == 0:
-                continue
-            if line[-1] == '\n':
-                line = line[:-1]
-            file_list.append(line)
-
-        listfile.close()
-        i += 2
-        modelformats.print_formats()
-        exit()
-        modelformats.print_extensions()
-        exit()
+            print('Unknown switch: {}'.format(arg))
+            exit()
+
+    modelformats.set_cache(cache_directory, cache_size * 1024 * 1024)
+
+    if profile:
+        profiling.enable()
+
+        if workers > 1:
+            print('Profiling collects data only in one process, -j switch is ignored.')
+            workers = 1
+
+    if pipelined and workers > 1:
+        print('Pipelined mode works in one process, -j switch is ignored.')
+        workers = 1
+
+    profiler = None
+
+    if cprofile_filename is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    # convert file
+    if batch_mode:
+        completed = modelformats.convert_list(file_list, in_format, in_params, out_format, out_params, workers, manifest_filename, pipelined)
     else:
-        print('Unknown switch: {}'.format(arg))
-        exit()
+        completed = modelformats.convert(in_format, in_filename, in_params, out_format, out_filename, out_params)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(cprofile_filename)
+
+    if profile:
+        if profile_filename is not None:
+            profiling.save_report(profile_filename)
+        else:
+            profiling.print_report()
+
+    sys.exit(0 if completed else 1)
 
 
-# convert file
-if batch_mode:
-    modelformats.convert_list(file_list, in_format, in_params, out_format, out_params)
-else:
-    modelformats.convert(in_format, in_filename, in_params, out_format, out_filename, out_params)
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,23 @@
 # Implements Colobot geometry specification
 # Copyright (c) 2014 Tomasz Kapuściński
 
+from array import array
 
+import profiling
+
+from geometry.arraymodel import ArrayModel
+from geometry.decimation import LOD_HIGH, LOD_LOW, LOD_MEDIUM, LOD_RATIOS, generate_lods
+from geometry.grouping import count_state_changes, group_triangles
+from geometry.indexedmesh import IndexedMesh, weld
+from geometry.lazymodel import LazyModel, TriangleView
 from geometry.material import Material
+from geometry.materialregistry import MaterialRegistry, material_key
 from geometry.model import Model
 from geometry.texcoord import TexCoord
 from geometry.triangle import Triangle
 from geometry.vector3d import Vector3D
 from geometry.vertex import Vertex
+from geometry.vertexcache import cache_miss_ratio, optimize_vertex_cache
 
 Normal = Vector3D
 VertexCoord = Vector3D
@@ -16,6 +26,11 @@ VertexCoord = Vector3D
 
 def triangulate(vertices: list[Vertex], flip_order: bool = False) -> list[Triangle]:
     """Triangulates polygon"""
+    with profiling.span('triangulate'):
+        return triangulate_fan(vertices, flip_order)
+
+
+def triangulate_fan(vertices: list[Vertex], flip_order: bool) -> list[Triangle]:
     result: list[Triangle] = []
 
     first = vertices[0]
@@ -42,6 +57,42 @@ def triangulate(vertices: list[Vertex], flip_order: bool = False) -> list[Triang
     return result
 
 
+def triangulate_polygons(sizes: array, flip_order: bool = False) -> tuple[array, array]:
+    """Triangulates polygons stored as consecutive corners
+
+    Returns corner index of every triangle corner and polygon index of every
+    triangle. Both are None when all polygons are triangles in given order.
+    """
+    with profiling.span('triangulate'):
+        if len(sizes) == 0 or (min(sizes) == 3 and max(sizes) == 3):
+            if not flip_order:
+                return None, None
+
+            corners = array('i', range(3 * len(sizes)))
+            corners[1::3], corners[2::3] = corners[2::3], corners[1::3]
+
+            return corners, None
+
+        corners = array('i')
+        polygons = array('i')
+
+        start = 0
+
+        for polygon, size in enumerate(sizes):
+            for i in range(2, size):
+                if flip_order:
+                    corners.extend((start, start + i, start + i - 1))
+                else:
+                    corners.extend((start, start + i - 1, start + i))
+
+            polygons.extend([polygon] * (size - 2))
+            start += size
+
+        profiling.count('triangulated_polygons', len(sizes))
+
+        return corners, polygons
+
+
 def encode_state(state: str) -> int:
     """Encodes state to number"""
     result = 0
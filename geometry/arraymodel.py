@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# Implements array-backed model representation
+
+from array import array
+
+from geometry.material import Material
+from geometry.materialregistry import MaterialRegistry
+from geometry.model import Model
+from geometry.texcoord import TexCoord
+from geometry.triangle import Triangle
+from geometry.vector3d import Vector3D
+from geometry.vertex import Vertex
+
+
+class ArrayModel:
+    """Model stored as contiguous per-vertex attribute buffers
+
+    Every triangle occupies 3 vertices in each buffer: 9 floats in positions
+    and normals, 6 floats in tex1 and tex2 and one entry in material_indices
+    pointing into the materials table.
+    """
+
+    __slots__ = ('positions', 'normals', 'tex1', 'tex2',
+                 'material_indices', 'material_registry', 'version')
+
+    def __init__(self, typecode: str = 'f'):
+        self.positions = array(typecode)
+        self.normals = array(typecode)
+        self.tex1 = array(typecode)
+        self.tex2 = array(typecode)
+        self.material_indices = array('i')
+        self.material_registry = MaterialRegistry()
+        self.version = -1
+
+    def __len__(self) -> int:
+        return len(self.material_indices)
+
+    @property
+    def materials(self) -> list[Material]:
+        return self.material_registry.materials
+
+    @property
+    def typecode(self) -> str:
+        return self.positions.typecode
+
+    def add_material(self, material: Material) -> int:
+        """Returns index of material in material table, adding it if needed"""
+        return self.material_registry.index(material)
+
+    def append_triangle(self, triangle: Triangle) -> None:
+        for vertex in triangle.vertices:
+            self.positions.extend(vertex.coord)
+            self.normals.extend(vertex.normal)
+            self.tex1.extend(vertex.tex1)
+            self.tex2.extend(vertex.tex2)
+
+        self.material_indices.append(self.add_material(triangle.material))
+
+    def get_triangle(self, index: int) -> Triangle:
+        triangle = Triangle()
+        triangle.material = self.materials[self.material_indices[index]]
+
+        for i in range(3):
+            k = 3 * index + i
+            triangle.vertices[i] = Vertex(
+                Vector3D(*self.positions[3*k:3*k+3]),
+                Vector3D(*self.normals[3*k:3*k+3]),
+                TexCoord(*self.tex1[2*k:2*k+2]),
+                TexCoord(*self.tex2[2*k:2*k+2]))
+
+        return triangle
+
+    def extend(self, model: Model) -> None:
+        for triangle in model.triangles:
+            self.append_triangle(triangle)
+
+        if model.version != -1:
+            self.version = model.version
+
+    def extend_arrays(self, model: 'ArrayModel') -> None:
+        for name in ('positions', 'normals', 'tex1', 'tex2'):
+            buffer = getattr(self, name)
+            other = getattr(model, name)
+
+            if buffer.typecode != other.typecode:
+                other = array(buffer.typecode, other)
+
+            buffer.extend(other)
+
+        remap = [self.add_material(material) for material in model.materials]
+        self.material_indices.extend(remap[index] for index in model.material_indices)
+
+        if model.version != -1:
+            self.version = model.version
+
+    def select(self, triangles: array) -> 'ArrayModel':
+        """Returns model with given triangles in given order"""
+        result = ArrayModel(self.typecode)
+
+        for name, size in (('positions', 9), ('normals', 9), ('tex1', 6), ('tex2', 6)):
+            buffer = getattr(self, name)
+            selected = array(buffer.typecode, bytes(buffer.itemsize * size * len(triangles)))
+
+            for component in range(size):
+                selected[component::size] = array(buffer.typecode, map(buffer[component::size].__getitem__, triangles))
+
+            setattr(result, name, selected)
+
+        result.material_indices = array('i', map(self.material_indices.__getitem__, triangles))
+        result.material_registry = self.material_registry
+        result.version = self.version
+
+        return result
+
+    def get_triangles(self, start: int, stop: int) -> list[Triangle]:
+        """Builds triangles in given index range"""
+        positions = self.positions[9*start:9*stop]
+        normals = self.normals[9*start:9*stop]
+        tex1 = self.tex1[6*start:6*stop]
+        tex2 = self.tex2[6*start:6*stop]
+
+        # build objects column by column
+        coords = map(Vector3D, positions[0::3], positions[1::3], positions[2::3])
+        normals = map(Vector3D, normals[0::3], normals[1::3], normals[2::3])
+        tex1 = map(TexCoord, tex1[0::2], tex1[1::2])
+        tex2 = map(TexCoord, tex2[0::2], tex2[1::2])
+
+        vertices = list(map(Vertex, coords, normals, tex1, tex2))
+        materials = map(self.materials.__getitem__, self.material_indices[start:stop])
+
+        return list(map(Triangle, map(list, zip(vertices[0::3], vertices[1::3], vertices[2::3])), materials))
+
+    def to_model(self, model: Model = None) -> Model:
+        """Builds list of triangles, optionally appending to existing model"""
+        if model is None:
+            model = Model()
+
+        model.triangles.extend(self.get_triangles(0, len(self)))
+
+        if self.version != -1:
+            model.version = self.version
+
+        return model
+
+    @classmethod
+    def from_model(cls, model: Model, typecode: str = 'f') -> 'ArrayModel':
+        result = cls(typecode)
+        result.extend(model)
+        return result
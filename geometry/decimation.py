@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# Implements level of detail generation by quadric error mesh simplification
+#
+# Edges are collapsed into one of their vertices, so no new vertices are made
+# and normals and texture coordinates stay exact. Cost of moving vertex is sum
+# of squared distances to planes of its original triangles (Garland and
+# Heckbert). Vertices on mesh borders, on texture or normal seams and on
+# boundaries between materials never move, so simplified parts still fit.
+
+import dataclasses
+import heapq
+import itertools
+import math
+from array import array
+from collections import Counter
+from operator import mul, sub
+
+from geometry.arraymodel import ArrayModel
+from geometry.indexedmesh import IndexedMesh
+from geometry.materialregistry import MaterialRegistry
+
+# lod_level values of Colobot
+LOD_HIGH = 4
+LOD_MEDIUM = 2
+LOD_LOW = 1
+
+# default triangle count of lower levels relative to full detail
+LOD_RATIOS = (0.5, 0.25)
+
+
+class Decimator:
+    """Simplifies triangles of one material by collapsing edges
+
+    Collapses continue from previous state, so levels with decreasing
+    triangle count can be taken one after another.
+    """
+
+    def __init__(self, positions: list[tuple], corners: array, locked: bytearray):
+        self.positions = positions
+        self.triangles = [list(corners[i:i + 3]) for i in range(0, len(corners), 3)]
+        self.alive = bytearray(b'\x01' * len(self.triangles))
+        self.count = len(self.triangles)
+        self.locked = locked
+        self.removed = bytearray(len(positions))
+        self.versions = [0] * len(positions)
+        self.quadrics = plane_quadrics(positions, corners)
+
+        self.vertex_triangles: list[set[int]] = [set() for _ in positions]
+
+        for triangle, vertices in enumerate(self.triangles):
+            for vertex in vertices:
+                self.vertex_triangles[vertex].add(triangle)
+
+        self.heap: list[tuple] = []
+
+        edges = {(min(a, b), max(a, b)) for a, b, c in self.triangles for a, b in ((a, b), (b, c), (c, a))}
+
+        for a, b in edges:
+            self.push(a, b)
+            self.push(b, a)
+
+    def push(self, source: int, target: int) -> None:
+        if not self.locked[source]:
+            cost = quadric_error(self.quadrics[source], self.positions[target])
+            heapq.heappush(self.heap, (cost, self.versions[source], self.versions[target], source, target))
+
+    def simplify(self, target_count: int) -> None:
+        """Collapses edges with the lowest cost until target triangle count is reached"""
+        while self.count > target_count and len(self.heap) > 0:
+            _, source_version, target_version, source, target = heapq.heappop(self.heap)
+
+            # entries of removed or changed vertices are outdated
+            if self.removed[source] or self.removed[target]:
+                continue
+
+            if self.versions[source] != source_version or self.versions[target] != target_version:
+                continue
+
+            if self.can_collapse(source, target):
+                self.collapse(source, target)
+
+    def can_collapse(self, source: int, target: int) -> bool:
+        shared = self.vertex_triangles[source] & self.vertex_triangles[target]
+
+        if len(shared) == 0:
+            return False
+
+        # vertices next to both ends must be only those of shared triangles,
+        # otherwise collapse would make non-manifold mesh
+        common = self.neighbours(source) & self.neighbours(target)
+
+        if len(common) != len(shared):
+            return False
+
+        # moved triangles must not turn over
+        position = self.positions[target]
+
+        for triangle in self.vertex_triangles[source] - shared:
+            vertices = [self.positions[vertex] for vertex in self.triangles[triangle]]
+            before = triangle_normal(*vertices)
+
+            vertices[self.triangles[triangle].index(source)] = position
+            after = triangle_normal(*vertices)
+
+            if sum(map(mul, before, after)) <= 0.0:
+                return False
+
+        return True
+
+    def collapse(self, source: int, target: int) -> None:
+        for triangle in self.vertex_triangles[source]:
+            vertices = self.triangles[triangle]
+
+            if target in vertices:
+                self.alive[triangle] = 0
+                self.count -= 1
+
+                for vertex in vertices:
+                    if vertex != source:
+                        self.vertex_triangles[vertex].discard(triangle)
+            else:
+                vertices[vertices.index(source)] = target
+                self.vertex_triangles[target].add(triangle)
+
+        self.vertex_triangles[source] = set()
+        self.removed[source] = 1
+
+        self.quadrics[target] = tuple(map(sum, zip(self.quadrics[target], self.quadrics[source])))
+        self.versions[target] += 1
+
+        for vertex in self.neighbours(target):
+            self.push(target, vertex)
+            self.push(vertex, target)
+
+    def neighbours(self, vertex: int) -> set[int]:
+        result = set(itertools.chain.from_iterable(self.triangles[triangle] for triangle in self.vertex_triangles[vertex]))
+        result.discard(vertex)
+        return result
+
+    def corners(self) -> array:
+        """Returns vertex indices of remaining triangles in original order"""
+        return array('i', itertools.chain.from_iterable(itertools.compress(self.triangles, self.alive)))
+
+
+def generate_lods(model: ArrayModel, ratios: tuple[float, ...] = LOD_RATIOS) -> ArrayModel:
+    """Returns model with levels of detail
+
+    Original triangles become high detail level. Every ratio makes lower
+    level with about this fraction of triangles of each material. Lower
+    levels the model already has are dropped and generated again.
+    """
+    levels = (LOD_HIGH, LOD_MEDIUM, LOD_LOW)[:len(ratios) + 1]
+
+    # only triangles without level or of high level are source of all levels
+    source = array('i', (triangle for triangle, material_index in enumerate(model.material_indices)
+                         if model.materials[material_index].lod in (0, LOD_HIGH)))
+
+    if len(source) < len(model):
+        model = model.select(source)
+
+    results = [ArrayModel(model.typecode) for _ in levels]
+
+    results[0].extend_arrays(model)
+
+    # triangles of every material are simplified separately
+    order = sorted(range(len(model)), key=model.material_indices.__getitem__)
+    start = 0
+
+    for material_index, count in sorted(Counter(model.material_indices).items()):
+        group = model.select(array('i', order[start:start + count]))
+        start += count
+
+        mesh = IndexedMesh.from_arrays(group)
+        positions = list(zip(mesh.positions[0::3], mesh.positions[1::3], mesh.positions[2::3]))
+
+        decimator = Decimator(positions, mesh.indices, locked_vertices(mesh, positions))
+        mesh_material = mesh.material_indices[:1]
+
+        for ratio, result in zip(ratios, results[1:]):
+            decimator.simplify(math.ceil(ratio * count))
+
+            mesh.indices = decimator.corners()
+            mesh.material_indices = mesh_material * (len(mesh.indices) // 3)
+            mesh.to_arrays(result)
+
+    # materials of each level are copies marked with level, materials
+    # differing only in level become one
+    for level, result in zip(levels, results):
+        materials = result.materials
+        result.material_registry = MaterialRegistry()
+
+        remap = [result.add_material(dataclasses.replace(material, lod=level)) for material in materials]
+        result.material_indices = array('i', map(remap.__getitem__, result.material_indices))
+
+    output = ArrayModel(model.typecode)
+
+    for result in results:
+        output.extend_arrays(result)
+
+    output.version = model.version
+
+    return output
+
+
+# returns flags of vertices which cannot move
+def locked_vertices(mesh: IndexedMesh, positions: list[tuple]) -> bytearray:
+    locked = bytearray(len(positions))
+
+    # vertices sharing position with different normal or texture coordinates lie on seam
+    position_ids: dict[tuple, int] = {}
+    ids = array('i', (position_ids.setdefault(position, len(position_ids)) for position in positions))
+
+    vertices_at = Counter(ids)
+
+    for vertex, position_id in enumerate(ids):
+        if vertices_at[position_id] > 1:
+            locked[vertex] = 1
+
+    # edges not shared by exactly two triangles lie on border or boundary of material
+    edges = Counter()
+    corners = mesh.indices
+
+    for i in range(0, len(corners), 3):
+        a, b, c = ids[corners[i]], ids[corners[i + 1]], ids[corners[i + 2]]
+        edges.update(((min(a, b), max(a, b)), (min(b, c), max(b, c)), (min(c, a), max(c, a))))
+
+    border = set(itertools.chain.from_iterable(edge for edge, count in edges.items() if count != 2))
+
+    for vertex, position_id in enumerate(ids):
+        if position_id in border:
+            locked[vertex] = 1
+
+    return locked
+
+
+# returns quadric of every vertex as sum of area weighted quadrics of planes of its triangles,
+# quadric is stored as coefficients aa, ab, ac, ad, bb, bc, bd, cc, cd, dd
+def plane_quadrics(positions: list[tuple], corners: array) -> list[tuple]:
+    quadrics = [(0.0,) * 10] * len(positions)
+
+    first = [positions[vertex] for vertex in corners[0::3]]
+    second = [positions[vertex] for vertex in corners[1::3]]
+    third = [positions[vertex] for vertex in corners[2::3]]
+
+    for i, normal in enumerate(map(triangle_normal, first, second, third)):
+        length = math.sqrt(sum(map(mul, normal, normal)))
+
+        if length == 0.0:
+            continue
+
+        # length of cross product is twice the area, which is the weight
+        a, b, c = (component / length for component in normal)
+        d = -(a * first[i][0] + b * first[i][1] + c * first[i][2])
+        weight = 0.5 * length
+
+        plane = (weight * a * a, weight * a * b, weight * a * c, weight * a * d,
+                 weight * b * b, weight * b * c, weight * b * d,
+                 weight * c * c, weight * c * d, weight * d * d)
+
+        for vertex in corners[3 * i:3 * i + 3]:
+            quadrics[vertex] = tuple(map(sum, zip(quadrics[vertex], plane)))
+
+    return quadrics
+
+
+def quadric_error(quadric: tuple, position: tuple) -> float:
+    aa, ab, ac, ad, bb, bc, bd, cc, cd, dd = quadric
+    x, y, z = position
+
+    return (aa * x * x + 2.0 * ab * x * y + 2.0 * ac * x * z + 2.0 * ad * x
+            + bb * y * y + 2.0 * bc * y * z + 2.0 * bd * y
+            + cc * z * z + 2.0 * cd * z + dd)
+
+
+# returns cross product of triangle edges, not normalized
+def triangle_normal(first: tuple, second: tuple, third: tuple) -> tuple:
+    ux, uy, uz = map(sub, second, first)
+    vx, vy, vz = map(sub, third, first)
+
+    return (uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx)
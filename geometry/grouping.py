@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Implements grouping of triangles by render state of their materials
+
+import operator
+from array import array
+
+from geometry.material import Material
+
+# ttexture_black, ttexture_white, ttexture_diffuse and alpha states,
+# drawn after opaque triangles when requested
+TRANSPARENT_STATES = (1 << 0) | (1 << 1) | (1 << 2) | (1 << 13)
+
+
+def render_key(material: Material) -> tuple:
+    """Returns key of everything that changes render state between triangles"""
+    return (material.state, material.texture1, material.texture2,
+            tuple(material.diffuse), tuple(material.ambient), tuple(material.specular))
+
+
+def group_triangles(materials: list[Material], material_indices: array, transparent_last: bool = False) -> array:
+    """Returns order of triangles sorted by render state of their materials
+
+    Sorting is stable, so triangles keep their order within material. Only
+    materials are compared, triangles are sorted by rank of their material.
+    """
+    def material_order(index: int) -> tuple:
+        material = materials[index]
+        transparent = transparent_last and (material.state & TRANSPARENT_STATES) != 0
+
+        return transparent, render_key(material), index
+
+    ranks = array('i', bytes(4 * len(materials)))
+
+    for rank, index in enumerate(sorted(range(len(materials)), key=material_order)):
+        ranks[index] = rank
+
+    triangle_ranks = array('i', map(ranks.__getitem__, material_indices))
+
+    return array('i', sorted(range(len(material_indices)), key=triangle_ranks.__getitem__))
+
+
+def count_state_changes(materials: list[Material], material_indices: array) -> int:
+    """Returns number of consecutive triangles with different render state"""
+    keys: dict[tuple, int] = {}
+    states = [keys.setdefault(render_key(material), len(keys)) for material in materials]
+    triangle_states = array('i', map(states.__getitem__, material_indices))
+
+    return sum(map(operator.ne, triangle_states[:-1], triangle_states[1:]))
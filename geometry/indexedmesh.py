@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# Implements indexed mesh with unique vertices and triangle index buffer
+
+import itertools
+import math
+from array import array
+from operator import itemgetter
+
+from geometry.arraymodel import ArrayModel
+from geometry.material import Material
+from geometry.materialregistry import MaterialRegistry
+from geometry.model import Model
+
+# number of vertices compared at once during welding
+CHUNK_SIZE = 1 << 14
+
+# attribute buffers with number of components and their slice of welded vertex
+ATTRIBUTES = (
+    ('positions', 3, itemgetter(0, 1, 2)),
+    ('normals', 3, itemgetter(3, 4, 5)),
+    ('tex1', 2, itemgetter(6, 7)),
+    ('tex2', 2, itemgetter(8, 9)),
+)
+
+
+class IndexedMesh:
+    """Model stored as buffers of unique vertices and triangle index buffer
+
+    Every unique vertex occupies 3 floats in positions and normals and
+    2 floats in tex1 and tex2. Every triangle has 3 entries in indices
+    pointing to its vertices and one entry in material_indices pointing
+    into the materials table.
+    """
+
+    __slots__ = ('positions', 'normals', 'tex1', 'tex2', 'indices',
+                 'material_indices', 'material_registry', 'version')
+
+    def __init__(self, typecode: str = 'f'):
+        self.positions = array(typecode)
+        self.normals = array(typecode)
+        self.tex1 = array(typecode)
+        self.tex2 = array(typecode)
+        self.indices = array('i')
+        self.material_indices = array('i')
+        self.material_registry = MaterialRegistry()
+        self.version = -1
+
+    def __len__(self) -> int:
+        return len(self.material_indices)
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.positions) // 3
+
+    @property
+    def materials(self) -> list[Material]:
+        return self.material_registry.materials
+
+    @property
+    def typecode(self) -> str:
+        return self.positions.typecode
+
+    def add_material(self, material: Material) -> int:
+        """Returns index of material in material table, adding it if needed"""
+        return self.material_registry.index(material)
+
+    def extend_arrays(self, model: ArrayModel, position_epsilon: float = 0.0,
+                      normal_epsilon: float = 0.0, tex_epsilon: float = 0.0) -> None:
+        """Appends triangles of ArrayModel, welding vertices within given epsilons
+
+        Vertices are welded only among appended triangles.
+        """
+        vertices, indices = weld([
+            (model.positions, 3, position_epsilon),
+            (model.normals, 3, normal_epsilon),
+            (model.tex1, 2, tex_epsilon),
+            (model.tex2, 2, tex_epsilon),
+        ])
+
+        offset = self.vertex_count
+
+        for name, _, getter in ATTRIBUTES:
+            getattr(self, name).extend(itertools.chain.from_iterable(map(getter, vertices)))
+
+        if offset > 0:
+            indices = array('i', map(offset.__add__, indices))
+
+        self.indices.extend(indices)
+
+        remap = [self.add_material(material) for material in model.materials]
+        self.material_indices.extend(map(remap.__getitem__, model.material_indices))
+
+        if model.version != -1:
+            self.version = model.version
+
+    def to_arrays(self, model: ArrayModel = None) -> ArrayModel:
+        """Expands vertices of every triangle, optionally appending to existing model"""
+        if model is None:
+            model = ArrayModel(self.typecode)
+
+        for name, size, _ in ATTRIBUTES:
+            buffer = getattr(self, name)
+            target = getattr(model, name)
+            expanded = array(target.typecode, bytes(target.itemsize * size * len(self.indices)))
+
+            for component in range(size):
+                expanded[component::size] = array(target.typecode, map(buffer[component::size].__getitem__, self.indices))
+
+            target.extend(expanded)
+
+        remap = [model.add_material(material) for material in self.materials]
+        model.material_indices.extend(map(remap.__getitem__, self.material_indices))
+
+        if self.version != -1:
+            model.version = self.version
+
+        return model
+
+    def to_model(self, model: Model = None) -> Model:
+        """Builds list of triangles, optionally appending to existing model"""
+        return self.to_arrays().to_model(model)
+
+    @classmethod
+    def from_arrays(cls, model: ArrayModel, position_epsilon: float = 0.0,
+                    normal_epsilon: float = 0.0, tex_epsilon: float = 0.0) -> 'IndexedMesh':
+        result = cls(model.typecode)
+        result.extend_arrays(model, position_epsilon, normal_epsilon, tex_epsilon)
+        return result
+
+    @classmethod
+    def from_model(cls, model: Model, typecode: str = 'f', position_epsilon: float = 0.0,
+                   normal_epsilon: float = 0.0, tex_epsilon: float = 0.0) -> 'IndexedMesh':
+        return cls.from_arrays(ArrayModel.from_model(model, typecode), position_epsilon, normal_epsilon, tex_epsilon)
+
+
+def weld(buffers: list[tuple[array, int, float]]) -> tuple[list[tuple], array]:
+    """Finds unique vertices in per-vertex attribute buffers
+
+    Buffers are given as (buffer, number of components, epsilon). Vertices are
+    welded when every component differs by no more than its epsilon. Returns
+    unique vertices as tuples of all components and index of unique vertex
+    for every vertex.
+    """
+    count = len(buffers[0][0]) // buffers[0][1]
+
+    index: dict[tuple, int] = {}
+    indices = array('i')
+
+    # exact duplicates are found by dictionary first
+    for first in range(0, count, CHUNK_SIZE):
+        last = min(first + CHUNK_SIZE, count)
+        columns = [buffer[size * first + component:size * last:size]
+                   for buffer, size, _ in buffers for component in range(size)]
+
+        keys = list(zip(*columns))
+
+        added = [key for key in dict.fromkeys(keys) if key not in index]
+        index.update(zip(added, range(len(index), len(index) + len(added))))
+        indices.extend(map(index.__getitem__, keys))
+
+    vertices = list(index)
+    del index
+
+    epsilons = [epsilon for _, size, epsilon in buffers for _ in range(size)]
+
+    if max(epsilons) > 0.0:
+        vertices, remap = weld_close(vertices, epsilons)
+        indices = array('i', map(remap.__getitem__, indices))
+
+    return vertices, indices
+
+
+def weld_close(vertices: list[tuple], epsilons: list[float]) -> tuple[list[tuple], array]:
+    """Merges vertices within epsilons of earlier vertex
+
+    Vertices are put into spatial hash of cells twice as large as epsilon of
+    first three components. Vertex close enough can be only in the same cell
+    or in the neighbouring cell on side nearer to vertex, so at most eight
+    cells are searched.
+    """
+    hashed = range(min(3, len(epsilons)))
+    scales = [0.5 / epsilons[i] if epsilons[i] > 0.0 else 0.0 for i in hashed]
+
+    grid: dict[tuple, list[int]] = {}
+    result: list[tuple] = []
+    remap = array('i')
+
+    for vertex in vertices:
+        # components without epsilon are hashed by exact value
+        ranges = []
+
+        for i in hashed:
+            if scales[i] > 0.0:
+                position = vertex[i] * scales[i]
+                cell = math.floor(position)
+                ranges.append((cell, cell - 1 if position - cell < 0.5 else cell + 1))
+            else:
+                ranges.append((vertex[i],))
+
+        found = -1
+
+        for cell in itertools.product(*ranges):
+            for candidate in grid.get(cell, ()):
+                other = result[candidate]
+
+                if all(abs(a - b) <= epsilon for a, b, epsilon in zip(vertex, other, epsilons)):
+                    found = candidate
+                    break
+
+            if found != -1:
+                break
+
+        if found == -1:
+            found = len(result)
+            result.append(vertex)
+            grid.setdefault(tuple(map(itemgetter(0), ranges)), []).append(found)
+
+        remap.append(found)
+
+    return result, remap
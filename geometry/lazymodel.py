@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Implements model view that builds triangles on demand
+
+from collections.abc import Sequence
+
+from geometry.arraymodel import ArrayModel
+from geometry.triangle import Triangle
+
+# number of triangles built at once during iteration
+CHUNK_SIZE = 4096
+
+
+class TriangleView(Sequence):
+    """Read-only sequence of triangles stored in ArrayModel buffers
+
+    Triangle objects are built only when accessed and are not kept, so
+    iterating over view needs memory for one chunk of triangles.
+    """
+
+    __slots__ = ('arrays',)
+
+    def __init__(self, arrays: ArrayModel):
+        self.arrays = arrays
+
+    def __len__(self) -> int:
+        return len(self.arrays)
+
+    def __getitem__(self, index: int | slice) -> Triangle | list[Triangle]:
+        count = len(self.arrays)
+
+        if isinstance(index, slice):
+            start, stop, step = index.indices(count)
+
+            if step == 1:
+                return self.arrays.get_triangles(start, max(start, stop))
+
+            return [self.arrays.get_triangle(i) for i in range(start, stop, step)]
+
+        if index < 0:
+            index += count
+
+        if index < 0 or index >= count:
+            raise IndexError('triangle index out of range')
+
+        return self.arrays.get_triangle(index)
+
+    def __iter__(self):
+        for start in range(0, len(self.arrays), CHUNK_SIZE):
+            yield from self.arrays.get_triangles(start, start + CHUNK_SIZE)
+
+
+class LazyModel:
+    """Model interface over ArrayModel without building list of triangles
+
+    Can be passed to code that expects geometry.Model and only reads it.
+    Writers that work on buffers should use arrays directly.
+    """
+
+    __slots__ = ('arrays', 'triangles')
+
+    def __init__(self, arrays: ArrayModel):
+        self.arrays = arrays
+        self.triangles = TriangleView(arrays)
+
+    @property
+    def version(self) -> int:
+        return self.arrays.version
+
+    @version.setter
+    def version(self, value: int) -> None:
+        self.arrays.version = value
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Implements material interning
+
+from geometry.material import Material
+
+
+def material_key(material: Material) -> tuple:
+    """Returns immutable key, equal for materials that compare equal"""
+    return (material.name, material.texture1, material.texture2,
+            tuple(material.ambient), tuple(material.diffuse), tuple(material.specular),
+            material.state, material.version, material.lod)
+
+
+class MaterialRegistry:
+    """Maps materials to shared canonical instances
+
+    The first material registered with a given key becomes canonical and
+    is returned for every equal material afterwards.
+    """
+
+    __slots__ = ('materials', '_indices', '_ids')
+
+    def __init__(self):
+        self.materials: list[Material] = []
+        self._indices: dict[tuple, int] = {}
+        self._ids: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.materials)
+
+    def index(self, material: Material) -> int:
+        """Returns index of canonical material, registering it if needed"""
+        # canonical instances are found by identity
+        index = self._ids.get(id(material))
+
+        if index is not None:
+            return index
+
+        key = material_key(material)
+        index = self._indices.get(key)
+
+        if index is None:
+            index = len(self.materials)
+            self.materials.append(material)
+            self._indices[key] = index
+            self._ids[id(material)] = index
+
+        return index
+
+    def intern(self, material: Material) -> Material:
+        """Returns canonical instance equal to material"""
+        return self.materials[self.index(material)]
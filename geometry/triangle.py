@@ -12,4 +12,4 @@ from geometry.material import Material
 @dataclass(slots=True)
 class Triangle:
     vertices: list[Vertex] = field(default_factory=lambda: [Vertex(), Vertex(), Vertex()])
-    material: Material = Material()
\ No newline at end of file
+    material: Material = field(default_factory=Material)
\ No newline at end of file
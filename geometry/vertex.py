@@ -2,7 +2,7 @@
 # Implements Colobot geometry specification
 # Copyright (c) 2014 Tomasz Kapuściński
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from geometry.vector3d import Vector3D
 from geometry.texcoord import TexCoord
@@ -10,7 +10,7 @@ from geometry.texcoord import TexCoord
 
 @dataclass(slots=True)
 class Vertex:
-    coord: Vector3D = Vector3D(0, 0, 0)
-    normal: Vector3D = Vector3D(0, 0, 0)
-    tex1: TexCoord = TexCoord(0.0, 0.0)
-    tex2: TexCoord = TexCoord(0.0, 0.0)
+    coord: Vector3D = field(default_factory=lambda: Vector3D(0, 0, 0))
+    normal: Vector3D = field(default_factory=lambda: Vector3D(0, 0, 0))
+    tex1: TexCoord = field(default_factory=lambda: TexCoord(0.0, 0.0))
+    tex2: TexCoord = field(default_factory=lambda: TexCoord(0.0, 0.0))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Implements triangle reordering for post-transform vertex cache
+#
+# Triangles are ordered with linear-speed algorithm by Tom Forsyth. Every
+# vertex has score depending on its position in simulated LRU cache and
+# number of triangles still using it. Next triangle is the one with highest
+# sum of vertex scores among triangles using vertices in cache.
+
+import itertools
+from array import array
+from collections import deque
+
+# default number of vertices in simulated cache
+CACHE_SIZE = 32
+
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+
+def optimize_vertex_cache(indices: array, cache_size: int = CACHE_SIZE) -> array:
+    """Returns order of triangles with better use of vertex cache
+
+    indices holds three vertex indices per triangle.
+    """
+    triangle_count = len(indices) // 3
+
+    # vertices are numbered locally, so part of larger mesh needs small tables
+    local = dict.fromkeys(indices)
+
+    for number, vertex in enumerate(local):
+        local[vertex] = number
+
+    corners = list(map(local.__getitem__, indices))
+    vertex_count = len(local)
+
+    # triangles using every vertex
+    vertex_triangles: list[list[int]] = [[] for _ in range(vertex_count)]
+
+    for corner, vertex in enumerate(corners):
+        vertex_triangles[vertex].append(corner // 3)
+
+    max_valence = max(map(len, vertex_triangles), default=0)
+
+    cache_scores = [LAST_TRIANGLE_SCORE] * 3 + [
+        (1.0 - (position - 3) / (cache_size - 3)) ** CACHE_DECAY_POWER for position in range(3, cache_size)]
+    valence_scores = [0.0] + [VALENCE_BOOST_SCALE * count ** -VALENCE_BOOST_POWER for count in range(1, max_valence + 1)]
+
+    vertex_scores = [valence_scores[len(triangles)] for triangles in vertex_triangles]
+    triangle_scores = [vertex_scores[corners[3 * i]] + vertex_scores[corners[3 * i + 1]] + vertex_scores[corners[3 * i + 2]]
+                       for i in range(triangle_count)]
+
+    added = bytearray(triangle_count)
+    order = array('i')
+    cache: list[int] = []
+
+    best = max(range(triangle_count), key=triangle_scores.__getitem__, default=-1)
+    next_unused = 0
+
+    while len(order) < triangle_count:
+        # no candidate in cache, continue with first triangle not added yet
+        if best == -1:
+            while added[next_unused]:
+                next_unused += 1
+
+            best = next_unused
+
+        added[best] = 1
+        order.append(best)
+
+        vertices = corners[3 * best:3 * best + 3]
+
+        for vertex in vertices:
+            vertex_triangles[vertex].remove(best)
+
+        # added vertices move to front of cache, the rest moves back
+        updated = vertices + [vertex for vertex in cache if vertex not in vertices]
+        cache = updated[:cache_size]
+
+        for position, vertex in enumerate(updated):
+            triangles = vertex_triangles[vertex]
+
+            # scores of vertices without remaining triangles are not used
+            if len(triangles) == 0:
+                continue
+
+            score = valence_scores[len(triangles)]
+
+            if position < cache_size:
+                score += cache_scores[position]
+
+            difference = score - vertex_scores[vertex]
+
+            if difference != 0.0:
+                vertex_scores[vertex] = score
+
+                for triangle in triangles:
+                    triangle_scores[triangle] += difference
+
+        candidates = itertools.chain.from_iterable(map(vertex_triangles.__getitem__, cache))
+        best = max(candidates, key=triangle_scores.__getitem__, default=-1)
+
+    return order
+
+
+def cache_miss_ratio(indices: array, cache_size: int = CACHE_SIZE) -> float:
+    """Returns average number of vertices transformed per triangle
+
+    Cache is simulated as FIFO queue, like in most GPUs.
+    """
+    if len(indices) == 0:
+        return 0.0
+
+    queue: deque = deque()
+    cached: set[int] = set()
+    misses = 0
+
+    for vertex in indices:
+        if vertex not in cached:
+            misses += 1
+            queue.append(vertex)
+            cached.add(vertex)
+
+            if len(queue) > cache_size:
+                cached.remove(queue.popleft())
+
+    return 3.0 * misses / len(indices)
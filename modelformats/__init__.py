@@ -2,13 +2,30 @@
 # Model format base implementation
 # Copyright (c) 2014 Tomasz Kapuściński
 
+import concurrent.futures
+import contextlib
+import importlib
+import io
+import os
+
 import geometry
+import profiling
 
+from modelformats.cache import ModelCache
+from modelformats.manifest import Manifest
 from modelformats.model import ModelFormat
+from modelformats.pipeline import convert_pipelined
+from modelformats.stages import STAGE_PARAMS, apply_stages
+
+# converter version, recorded in conversion manifests
+version = '1.7'
 
 formats: dict[str, ModelFormat] = {}
 extensions: dict[str, str] = {}
 
+# (input format type, output format type) -> (function, input params, output params)
+transcoders: dict[tuple[type, type], tuple] = {}
+
 # registers format
 def register_format(name: str, fmt: ModelFormat) -> None:
     formats[name] = fmt
@@ -19,6 +36,13 @@ def register_extension(ext: str, name: str) -> None:
     extensions[ext] = name
 
 
+# registers function converting file between two formats directly, without
+# building model, called as function(in_filename, in_params, out_filename, out_params);
+# it is used only when all given params are among supported param names
+def register_transcoder(in_name: str, out_name: str, function, in_params: tuple[str, ...] = (), out_params: tuple[str, ...] = ()) -> None:
+    transcoders[(type(formats[in_name]), type(formats[out_name]))] = (function, in_params, out_params)
+
+
 def get_format(name: str) -> ModelFormat:
     if name in formats:
         return formats[name]
@@ -42,24 +66,265 @@ def get_extension(filename: str) -> str:
         return None
 
 
-def read(fmt: str, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
+# returns actual format used for given file, resolving default format by extension
+def resolve_format(fmt: str, filename: str) -> ModelFormat:
+    model_format = get_format(fmt)
+
+    if model_format is not None and hasattr(model_format, 'resolve'):
+        model_format = model_format.resolve(filename)
+
+    return model_format
+
+
+# creates empty model in representation preferred by format reading given file
+def new_model(fmt: str, filename: str) -> geometry.Model | geometry.ArrayModel:
+    model_format = resolve_format(fmt, filename)
+
+    if model_format is not None and model_format.reads_arrays:
+        return geometry.ArrayModel(model_format.array_typecode)
+
+    return geometry.Model()
+
+
+# cache of parsed models used by read, disabled by default
+cache: ModelCache = None
+
+
+def set_cache(directory: str, max_size: int) -> None:
+    global cache
+
+    if directory is None:
+        cache = None
+    else:
+        cache = ModelCache(directory, max_size, version)
+
+
+def read(fmt: str, filename: str, model: geometry.Model | geometry.ArrayModel | geometry.LazyModel | geometry.IndexedMesh, params: dict[str, str]) -> bool:
     model_format: ModelFormat = get_format(fmt)
 
     if model_format is None:
         print('Unknown format: ' + fmt)
         return False
-        
+
+    # indexed mesh is read into buffers and welded afterwards
+    if isinstance(model, geometry.IndexedMesh):
+        arrays = geometry.ArrayModel(model.typecode)
+        completed = read(fmt, filename, arrays, params)
+
+        if completed:
+            with profiling.span('weld'):
+                model.extend_arrays(arrays)
+
+        return completed
+
+    # lazy model is read into its buffers
+    if isinstance(model, geometry.LazyModel):
+        model = model.arrays
+
+    with profiling.span('read'):
+        completed = read_cached(model_format, fmt, filename, model, params)
+
+    if completed and profiling.enabled:
+        profiling.count('bytes_read', os.path.getsize(filename))
+        count_model(model)
+
+    return completed
+
+
+# reads model through cache of parsed models if it is enabled
+def read_cached(model_format: ModelFormat, fmt: str, filename: str, model: geometry.Model | geometry.ArrayModel, params: dict[str, str]) -> bool:
+    if cache is None:
+        return read_format(model_format, filename, model, params)
+
+    with profiling.span('read.cache'):
+        key = cache.key(fmt, filename, params, get_dependencies(fmt, filename, params))
+
+        if cache.load(key, model):
+            profiling.count('cache_hits')
+            return True
+
+    completed = read_format(model_format, filename, model, params)
+
+    if completed:
+        with profiling.span('read.cache'):
+            cache.store(key, model)
+
+    return completed
+
+
+def read_format(model_format: ModelFormat, filename: str, model: geometry.Model | geometry.ArrayModel, params: dict[str, str]) -> bool:
+    if isinstance(model, geometry.ArrayModel):
+        return model_format.read_arrays(filename, model, params)
+
     return model_format.read(filename, model, params)
 
 
-def write(fmt: str, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
+def write(fmt: str, filename: str, model: geometry.Model | geometry.ArrayModel | geometry.LazyModel | geometry.IndexedMesh, params: dict[str, str]) -> bool:
     model_format = get_format(fmt)
 
     if model_format is None:
         print('Unknown format: ' + fmt)
         return False
 
-    return model_format.write(filename, model, params)
+    # indexed mesh is expanded for writers
+    if isinstance(model, geometry.IndexedMesh):
+        model = model.to_arrays()
+
+    # stages change copy of buffers before writer runs
+    if any(name in params for name in STAGE_PARAMS):
+        if not isinstance(model, geometry.ArrayModel):
+            model = geometry.ArrayModel.from_model(model, 'd')
+
+        model = apply_stages(filename, model, params)
+
+        if model is None:
+            return False
+
+    # formats writing buffers do not need triangle objects at all
+    if isinstance(model, geometry.LazyModel):
+        model = model.arrays
+
+    with profiling.span('write'):
+        if isinstance(model, geometry.ArrayModel):
+            completed = model_format.write_arrays(filename, model, params)
+        else:
+            completed = model_format.write(filename, model, params)
+
+    if completed and profiling.enabled:
+        # formats like OBJ write more than one file
+        paths = model_format.get_output_files(filename, params)
+        profiling.count('bytes_written', sum(os.path.getsize(path) for path in paths))
+
+    return completed
+
+
+# counts triangles, unique vertices and unique materials for profiling
+def count_model(model: geometry.Model | geometry.ArrayModel) -> None:
+    if not isinstance(model, geometry.ArrayModel):
+        model = geometry.ArrayModel.from_model(model, 'd')
+
+    vertices = zip(model.positions[0::3], model.positions[1::3], model.positions[2::3],
+                   model.normals[0::3], model.normals[1::3], model.normals[2::3],
+                   model.tex1[0::2], model.tex1[1::2], model.tex2[0::2], model.tex2[1::2])
+
+    profiling.count('triangles', len(model))
+    profiling.count('unique_vertices', len(set(vertices)))
+    profiling.count('unique_materials', len(model.materials))
+
+
+# returns list of output format names from comma separated list
+def get_format_list(text: str) -> list[str]:
+    return [name for name in text.split(',') if name != '']
+
+
+# returns output params for one format, params prefixed with 'format:' apply only to that format
+def get_format_params(params: dict[str, str], fmt: str) -> dict[str, str]:
+    result = {name: value for name, value in params.items() if ':' not in name}
+    prefix = fmt + ':'
+
+    for name, value in params.items():
+        if name.startswith(prefix):
+            result[name[len(prefix):]] = value
+
+    return result
+
+
+# returns list of (format, filename, params) outputs, returns None if filename cannot be made
+def get_outputs(out_formats: list[str], out_filename: str, out_params: dict[str, str], replace_extension: bool) -> list[tuple[str, str, dict[str, str]]]:
+    outputs = []
+
+    index = out_filename.rfind('.')
+
+    if index == -1:
+        filename_part = out_filename
+    else:
+        filename_part = out_filename[:index]
+
+    for fmt in out_formats:
+        filename = out_filename
+
+        if replace_extension:
+            extension = get_format(fmt).get_extension()
+
+            if extension is None:
+                print(f'Cannot convert file {out_filename}, unknown extension of output format {fmt}.')
+                return None
+
+            filename = f'{filename_part}.{extension}'
+
+        outputs.append((fmt, filename, get_format_params(out_params, fmt)))
+
+    return outputs
+
+
+# writes model to all outputs, concurrently if there are more than one and parallel is set
+def write_outputs(model: geometry.Model | geometry.ArrayModel, outputs: list[tuple[str, str, dict[str, str]]], parallel: bool = True) -> list[bool]:
+    # profiled writes run one by one so phase times do not overlap
+    if len(outputs) == 1 or profiling.enabled or not parallel:
+        return [write(fmt, filename, model, params) for fmt, filename, params in outputs]
+
+    with concurrent.futures.ThreadPoolExecutor(len(outputs)) as executor:
+        futures = [executor.submit(write, fmt, filename, model, params) for fmt, filename, params in outputs]
+
+    return [future.result() for future in futures]
+
+
+# returns transcoder function for conversion to single output, None if model has to be built
+def get_transcoder(in_format: str, in_filename: str, in_params: dict[str, str], outputs: list[tuple[str, str, dict[str, str]]]):
+    if len(outputs) != 1:
+        return None
+
+    out_format, out_filename, out_params = outputs[0]
+
+    in_model_format = resolve_format(in_format, in_filename)
+    out_model_format = resolve_format(out_format, out_filename)
+
+    if in_model_format is None or out_model_format is None:
+        return None
+
+    transcoder = transcoders.get((type(in_model_format), type(out_model_format)))
+
+    if transcoder is None:
+        return None
+
+    function, supported_in_params, supported_out_params = transcoder
+
+    for params, supported in ((in_params, supported_in_params), (out_params, supported_out_params)):
+        for name in params:
+            if name != 'directory' and name not in supported:
+                return None
+
+    return function
+
+
+# converts input file to all outputs, directly if transcoder is available,
+# returns success flag of every output
+def convert_outputs(in_format: str, in_filename: str, in_params: dict[str, str], outputs: list[tuple[str, str, dict[str, str]]]) -> list[bool]:
+    transcoder = get_transcoder(in_format, in_filename, in_params, outputs)
+
+    if transcoder is not None:
+        return [run_transcoder(transcoder, in_filename, in_params, outputs[0])]
+
+    model = new_model(in_format, in_filename)
+
+    if not read(in_format, in_filename, model, in_params):
+        return [False] * len(outputs)
+
+    return write_outputs(model, outputs)
+
+
+# converts input file to single output with transcoder
+def run_transcoder(transcoder, in_filename: str, in_params: dict[str, str], output: tuple[str, str, dict[str, str]]) -> bool:
+    out_format, out_filename, out_params = output
+
+    with profiling.span('transcode'):
+        completed = transcoder(in_filename, in_params, out_filename, out_params)
+
+    if completed and profiling.enabled:
+        profiling.count('bytes_read', os.path.getsize(in_filename))
+        profiling.count('bytes_written', os.path.getsize(out_filename))
+
+    return completed
 
 
 def convert(in_format: str, in_filename: str, in_params: dict[str, str], out_format: str, out_filename: str, out_params: dict[str, str]) -> bool:
@@ -71,39 +336,129 @@ def convert(in_format: str, in_filename: str, in_params: dict[str, str], out_for
         print('Output file not specified.')
         return False
 
+    out_formats = get_format_list(out_format)
+
+    for fmt in out_formats:
+        if get_format(fmt) is None:
+            print('Unknown format: ' + fmt)
+            return False
+
     if 'directory' in in_params:
         in_filename = in_params['directory'] + '/' + in_filename
 
     if 'directory' in out_params:
         out_filename = out_params['directory'] + '/' + out_filename
 
-    model = geometry.Model()
+    outputs = get_outputs(out_formats, out_filename, out_params, len(out_formats) > 1)
+    if outputs is None:
+        return False
 
-    completed = read(in_format, in_filename, model, in_params)
-    if not completed:
-        return
+    results = convert_outputs(in_format, in_filename, in_params, outputs)
+
+    for (fmt, filename, params), completed in zip(outputs, results):
+        if completed:
+            print(f'{in_filename} -> {filename}')
+
+    return all(results)
+
+
+# converts single file of batch to all outputs, returns success flag and console output
+def convert_file(in_format: str, in_filename: str, in_params: dict[str, str], outputs: list[tuple[str, str, dict[str, str]]]) -> tuple[bool, str]:
+    log = io.StringIO()
+
+    with contextlib.redirect_stdout(log):
+        try:
+            results = convert_outputs(in_format, in_filename, in_params, outputs)
+        except Exception as e:
+            print(f'Error: {type(e).__name__}: {e}')
+            results = [False]
+
+        completed = print_results(in_filename, outputs, results)
+
+    return completed, log.getvalue()
+
+
+# prints written outputs of one file, returns True if all were written
+def print_results(in_filename: str, outputs: list[tuple[str, str, dict[str, str]]], results: list[bool]) -> bool:
+    for (fmt, filename, params), written in zip(outputs, results):
+        if written:
+            print(f'{in_filename} -> {filename}')
+
+    completed = all(results)
 
-    completed = write(out_format, out_filename, model, out_params)
     if not completed:
-        return
+        print(f'Failed to convert {in_filename}')
+
+    return completed
+
+
+# imports modules with format implementations and sets up cache in worker process
+def init_worker(module_names: list[str], cache_settings: tuple) -> None:
+    for name in module_names:
+        importlib.import_module(name)
+
+    set_cache(*cache_settings)
+
+
+# converts files with process pool, yields results in submission order
+def convert_parallel(jobs: list[tuple], workers: int):
+    module_names = sorted({type(fmt).__module__ for fmt in formats.values()} |
+                          {transcoder[0].__module__ for transcoder in transcoders.values()})
+    cache_settings = (None, 0)
+
+    if cache is not None:
+        cache_settings = (cache.directory, cache.max_size)
+
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker, initargs=(module_names, cache_settings)) as executor:
+        yield from executor.map(convert_file, *zip(*jobs))
+
+
+# returns paths of files model read from given file depends on, like material libraries
+def get_dependencies(fmt: str, filename: str, params: dict[str, str]) -> list[str]:
+    model_format = get_format(fmt)
+
+    if model_format is None:
+        return []
+
+    # missing or unreadable input is reported when it is converted
+    try:
+        return model_format.get_dependencies(filename, params)
+    except OSError:
+        return []
+
 
-    print(f'{in_filename} -> {out_filename}')
+# returns number of worker processes for -j value, 0 means all cores, None if value is invalid
+def get_worker_count(value: str) -> int:
+    if value == 'auto':
+        return os.cpu_count() or 1
 
+    try:
+        count = int(value)
+    except ValueError:
+        print(f'Invalid number of workers: {value}')
+        return None
+
+    if count <= 0:
+        return os.cpu_count() or 1
+
+    return count
 
-def convert_list(file_list: list[str], in_format: str, in_params: dict[str, str], out_format: str, out_params: dict[str, ]) -> None:
+
+def convert_list(file_list: list[str], in_format: str, in_params: dict[str, str], out_format: str, out_params: dict[str, ], workers: int = 1, manifest_filename: str = None, pipelined: bool = False) -> bool:
     in_filename = ''
     out_filename = ''
 
     in_modelformat = get_format(in_format)
-    out_modelformat = get_format(out_format)
+    out_formats = get_format_list(out_format)
 
     if in_modelformat is None:
         print(f'Unknown input format: {in_format}')
-        return
+        return False
 
-    if out_modelformat is None:
-        print(f'Unknown output format: {out_format}')
-        return
+    for fmt in out_formats:
+        if get_format(fmt) is None:
+            print(f'Unknown output format: {fmt}')
+            return False
 
     in_directory = ''
     if 'directory' in in_params:
@@ -113,43 +468,97 @@ def convert_list(file_list: list[str], in_format: str, in_params: dict[str, str]
     if 'directory' in out_params:
         out_directory = out_params['directory'] + '/'
 
+    # jobs are (input format, input filename, input params, outputs)
+    jobs: list[tuple] = []
+    failed: list[str] = []
+
     for pair in file_list:
         # parse input string
         if ':' in pair:
             parts = pair.split(':')
             in_filename = parts[0]
             out_filename = parts[1]
+            replace_extension = len(out_formats) > 1
         else:
-            index = pair.rfind('.')
-
-            if index == -1:
-                filename_part = pair
-            else:
-                filename_part = pair[:index]
-
-            extension = out_modelformat.get_extension()
-
-            if extension is None:
-                print(f'Cannot convert file {pair}, unknown output format.')
-                continue
-
             in_filename = pair
-            out_filename = f'{filename_part}.{extension}'
+            out_filename = pair
+            replace_extension = True
 
         # append directory path
         in_filename = in_directory + in_filename
         out_filename = out_directory + out_filename
 
-        # convert format
-        model = geometry.Model()
+        outputs = get_outputs(out_formats, out_filename, out_params, replace_extension)
 
-        in_modelformat.read(in_filename, model, in_params)
-        out_modelformat.write(out_filename, model, out_params)
+        if outputs is None:
+            failed.append(pair)
+            continue
 
-        print(f'{in_filename} -> {out_filename}')
+        jobs.append((in_format, in_filename, in_params, outputs))
 
     if len(file_list) == 0:
         print('Batch list empty. No files converted.')
+        return True
+
+    # skip outputs converted before with same input and settings
+    manifest = None
+    skipped = 0
+
+    if manifest_filename is not None:
+        manifest = Manifest(manifest_filename, version)
+
+    pending: list[tuple] = []
+
+    for in_format, in_filename, in_params, outputs in jobs:
+        if manifest is not None:
+            dependencies = get_dependencies(in_format, in_filename, in_params)
+            current = [output for output in outputs if manifest.is_current(in_format, in_filename, in_params, *output, dependencies)]
+
+            for output in current:
+                print(f'{in_filename} -> {output[1]} (up to date)')
+
+            outputs = [output for output in outputs if output not in current]
+
+            if len(outputs) == 0:
+                skipped += 1
+                continue
+
+        pending.append((in_format, in_filename, in_params, outputs))
+
+    # convert formats
+    if workers > 1 and len(pending) > 1:
+        results = convert_parallel(pending, min(workers, len(pending)))
+    elif pipelined:
+        results = convert_pipelined(pending)
+    else:
+        results = (convert_file(*job) for job in pending)
+
+    for job, (completed, log) in zip(pending, results):
+        print(log, end='')
+
+        in_format, in_filename, in_params, outputs = job
+
+        if not completed:
+            failed.append(in_filename)
+        elif manifest is not None:
+            dependencies = get_dependencies(in_format, in_filename, in_params)
+
+            for output in outputs:
+                manifest.update(in_format, in_filename, in_params, *output, dependencies)
+
+    if manifest is not None:
+        manifest.save()
+
+    print(f'{len(file_list) - len(failed)} of {len(file_list)} files converted'
+          f' ({skipped} up to date).')
+
+    if len(failed) > 0:
+        print('Failed files:')
+
+        for filename in failed:
+            print(f'  {filename}')
+
+    return len(failed) == 0
 
 
 def print_formats():
@@ -172,6 +581,31 @@ def get_param(params: dict[str, str], name: str, default: str = None) -> str:
     else:
         return default
 
+# reads text file in large blocks, yields lists of complete lines without eol
+def iter_line_blocks(input_file, block_size: int = 1 << 20):
+    rest = ''
+
+    while True:
+        block = input_file.read(block_size)
+
+        if not block:
+            break
+
+        end = block.rfind('\n')
+
+        if end == -1:
+            rest += block
+            continue
+
+        lines = (rest + block[:end]).split('\n')
+        rest = block[end+1:]
+
+        yield lines
+
+    if rest:
+        yield [rest]
+
+
 def parse_vertex(values: list[str]) -> geometry.Vertex:
     vertex_coord = geometry.VertexCoord(float(values[2]), float(values[3]), float(values[4]))
     normal = geometry.Normal(float(values[6]), float(values[7]), float(values[8]))
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+# Implements content-addressed cache of parsed models
+
+import dataclasses
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+import geometry
+from modelformats.manifest import file_digest
+
+# params not changing parsed model, left out of cache key
+UNKEYED_PARAMS = ('directory', 'mmap')
+
+# magic, buffer typecode, triangle count, model version, material table size
+CACHE_HEADER = struct.Struct('=8scIiI')
+CACHE_MAGIC = b'CMCACHE1'
+
+
+class ModelCache:
+    """Stores parsed models in directory, keyed by input contents and settings
+
+    Contents of files the model depends on, like material libraries, are
+    part of the key too. Models are stored as raw ArrayModel buffers. Least
+    recently used entries are removed once total size exceeds max_size bytes.
+    """
+
+    def __init__(self, directory: str, max_size: int, version: str):
+        self.directory = directory
+        self.max_size = max_size
+        self.version = version
+
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, fmt: str, filename: str, params: dict[str, str], dependencies: list[str] = ()) -> str:
+        settings = {name: value for name, value in params.items() if name not in UNKEYED_PARAMS}
+
+        # other files read with model are keyed by contents, missing ones as None
+        digests = [file_digest(path) if os.path.isfile(path) else None for path in dependencies]
+
+        text = json.dumps([self.version, file_digest(filename), fmt, settings, digests], sort_keys=True)
+
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.model')
+
+    def load(self, key: str, model: geometry.Model | geometry.ArrayModel) -> bool:
+        """Loads cached model, returns False on cache miss"""
+        path = self.path(key)
+
+        try:
+            with open(path, 'rb') as input_file:
+                data = input_file.read()
+        except OSError:
+            return False
+
+        arrays = decode_model(data)
+
+        # damaged entry is removed and counts as cache miss
+        if arrays is None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            return False
+
+        # mark as recently used
+        os.utime(path)
+
+        if isinstance(model, geometry.ArrayModel):
+            model.extend_arrays(arrays)
+        else:
+            arrays.to_model(model)
+
+        return True
+
+    def store(self, key: str, model: geometry.Model | geometry.ArrayModel) -> None:
+        if not isinstance(model, geometry.ArrayModel):
+            model = geometry.ArrayModel.from_model(model, 'd')
+
+        data = encode_model(model)
+
+        # write atomically, other processes may read cache at the same time
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+
+        with os.fdopen(handle, 'wb') as output_file:
+            output_file.write(data)
+
+        os.replace(temp_path, self.path(key))
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes least recently used entries above size limit"""
+        entries = []
+        total = 0
+
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.model'):
+                continue
+
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+
+        entries.sort()
+
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            total -= size
+
+
+def encode_model(model: geometry.ArrayModel) -> bytes:
+    materials = json.dumps([dataclasses.asdict(mat) for mat in model.materials]).encode('utf-8')
+
+    return b''.join((
+        CACHE_HEADER.pack(CACHE_MAGIC, model.typecode.encode('ascii'), len(model), model.version, len(materials)),
+        materials,
+        model.positions.tobytes(),
+        model.normals.tobytes(),
+        model.tex1.tobytes(),
+        model.tex2.tobytes(),
+        model.material_indices.tobytes(),
+    ))
+
+
+def decode_model(data: bytes) -> geometry.ArrayModel:
+    if len(data) < CACHE_HEADER.size:
+        return None
+
+    magic, typecode, count, version, materials_size = CACHE_HEADER.unpack_from(data)
+
+    if magic != CACHE_MAGIC:
+        return None
+
+    data = memoryview(data)
+    offset = CACHE_HEADER.size
+
+    # damaged entry has wrong typecode, materials or buffer sizes
+    try:
+        model = geometry.ArrayModel(typecode.decode('ascii'))
+        model.version = version
+
+        for values in json.loads(bytes(data[offset:offset + materials_size])):
+            model.add_material(geometry.Material(**values))
+
+        offset += materials_size
+
+        for buffer, size in ((model.positions, 9), (model.normals, 9), (model.tex1, 6), (model.tex2, 6),
+                             (model.material_indices, 1)):
+            length = buffer.itemsize * size * count
+            buffer.frombytes(data[offset:offset + length])
+            offset += length
+    except (ValueError, TypeError):
+        return None
+
+    if offset != len(data):
+        return None
+
+    return model
@@ -2,63 +2,627 @@
 # Contains implementation of COLLADA .dae model format
 # Copyright (c) 2015 Tomasz Kapuściński
 
-from xml.dom import minidom
-
+import collections
+import datetime
+import itertools
+import os
+import re
+import urllib.parse
+from array import array
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
 
 import geometry
-from modelformats import ModelFormat, register_format, register_extension
+import profiling
+from modelformats import ModelFormat, get_param, register_format, register_extension
+
+# elements with <input> and <p> children converted to triangles
+PRIMITIVES = ('triangles', 'polylist', 'polygons')
+
+# model buffer, number of components and whether v coordinate is flipped for input semantic
+SEMANTICS = {
+    'POSITION': ('positions', 3, False),
+    'NORMAL': ('normals', 3, False),
+}
+
+# texture coordinate sets, in order of set number
+TEXCOORD_BUFFERS = ('tex1', 'tex2')
+
+# number of characters of number list converted at once
+NUMBER_BLOCK_SIZE = 1 << 20
+
+whitespace_pattern = re.compile(r'\s')
+
+# number of triangles or numbers formatted at once by writer
+WRITE_CHUNK_SIZE = 1 << 14
+
+# state regex pattern
+state_pattern = re.compile(r'^.+(\[(.+?)\])$')
 
 
 class COLLADAFormat(ModelFormat):
     description: str = 'COLLADA .dae format'
     ext: str = 'dae'
 
-    def read(self, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
-        xmldoc = minidom.parse(filename)
+    reads_arrays: bool = True
+    writes_arrays: bool = True
+    array_typecode: str = 'd'
 
-        # parse materials
-        materials_xml = xmldoc.getElementsByTagName('library_materials')[0]
-        materials = {}
+    def read_arrays(self, filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> bool:
+        reader = ColladaReader(filename, model)
 
-        for material_xml in materials_xml.getElementsByTagName('material'):
-            material = geometry.Material()
+        try:
+            with profiling.span('read.collada.parse'):
+                for event, element in ElementTree.iterparse(filename, events=('start', 'end')):
+                    tag = element.tag.rpartition('}')[2]
 
-            material_name = material_xml.getAttribute('name')
-            # material_id = material_xml.getElementsByTagName('instance_effect')[0].getAttribute('url')[1:]
+                    if event == 'start':
+                        reader.start(tag, element)
+                        reader.path.append(tag)
+                    else:
+                        reader.path.pop()
+                        reader.end(tag, element)
 
-            # finding proper effects tag
-            # effect_xml = None
+                        # content is consumed, only empty element stays in tree
+                        element.clear()
+        except ElementTree.ParseError as e:
+            print(f'Invalid COLLADA file {filename}: {e}')
+            return False
+        except (AttributeError, KeyError, ValueError, IndexError) as e:
+            print(f'Invalid geometry in file {filename}: {e}')
+            return False
 
-            # for effect in xmldoc.getElementsByTagName('effect'):
-            # if effect.getAttribute('id') == material_id:
-            # effect_xml = effect
+        reader.finish(get_param(params, 'texture', ''))
 
-            material.texture1 = params['texture']
+        return True
 
-            # end of material definition
-            materials[material_name] = material
+    def write_arrays(self, filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> bool:
+        # float32 buffers are written with precision they have
+        if model.typecode == 'f':
+            formatter = '%.9g'.__mod__
+        else:
+            formatter = repr
 
-        # parse vertex data
-        # mesh_xml = xmldoc.getElementsByTagName('mesh')[0]
+        # unique attribute values and their index for every vertex
+        with profiling.span('write.collada.index'):
+            sources = [
+                ('positions', 'POSITION', ('X', 'Y', 'Z')) + index_attribute(model.positions, 3, False),
+                ('normals', 'NORMAL', ('X', 'Y', 'Z')) + index_attribute(model.normals, 3, False),
+                ('texcoords', 'TEXCOORD', ('S', 'T')) + index_attribute(model.tex1, 2, True),
+            ]
 
-        # vertex arrays
-        # vertex_arrays: list[geometry.Vertex] = {}
+            # second texture coordinates only when used
+            if any(model.tex2):
+                sources.append(('texcoords2', 'TEXCOORD', ('S', 'T')) + index_attribute(model.tex2, 2, True))
 
-        for source_xml in xmldoc.getElementsByTagName('source'):
-            source_id = source_xml.getAttribute('id')
-            float_array = source_xml.getElementsByTagName('float_array')
+            # triangles grouped by material, in original order within material
+            order = sorted(range(len(model)), key=model.material_indices.__getitem__)
+            counts = collections.Counter(model.material_indices)
 
-            if len(float_array) < 1:
-                continue
+        now = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        with profiling.span('write.collada.format'), open(filename, 'w', encoding='utf8', buffering=1 << 20) as output_file:
+            output_file.write('<?xml version="1.0" encoding="utf-8"?>\n'
+                              '<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">\n'
+                              '  <asset>\n'
+                              '    <created>%s</created>\n'
+                              '    <modified>%s</modified>\n'
+                              '    <up_axis>Y_UP</up_axis>\n'
+                              '  </asset>\n'
+                              % (now, now))
+
+            write_materials(output_file, model.materials)
+
+            output_file.write('  <library_geometries>\n'
+                              '    <geometry id="mesh" name="mesh">\n'
+                              '      <mesh>\n')
+
+            for name, semantic, params_names, values, _ in sources:
+                count = len(values) // len(params_names)
+
+                output_file.write('        <source id="mesh-%s">\n'
+                                  '          <float_array id="mesh-%s-array" count="%d">' % (name, name, len(values)))
+                write_numbers(output_file, values, formatter)
+                output_file.write('</float_array>\n'
+                                  '          <technique_common>\n'
+                                  '            <accessor source="#mesh-%s-array" count="%d" stride="%d">\n'
+                                  % (name, count, len(params_names)))
+
+                for param_name in params_names:
+                    output_file.write('              <param name="%s" type="float"/>\n' % param_name)
+
+                output_file.write('            </accessor>\n'
+                                  '          </technique_common>\n'
+                                  '        </source>\n')
 
-            text = ''.join(t.nodeValue for t in float_array[0].childNodes)
+            output_file.write('        <vertices id="mesh-vertices">\n'
+                              '          <input semantic="POSITION" source="#mesh-positions"/>\n'
+                              '        </vertices>\n')
 
-            print(source_id)
-            print(text)
-            print(' ')
+            indices = [source[4] for source in sources]
+            start = 0
+
+            for material_index in range(len(model.materials)):
+                count = counts.get(material_index, 0)
+
+                if count == 0:
+                    continue
+
+                output_file.write('        <triangles material="material-%d" count="%d">\n'
+                                  '          <input semantic="VERTEX" source="#mesh-vertices" offset="0"/>\n'
+                                  % (material_index, count))
+
+                for offset, (name, semantic, _, _, _) in enumerate(sources[1:], 1):
+                    texcoord_set = ' set="%d"' % (offset - 2) if semantic == 'TEXCOORD' else ''
+                    output_file.write('          <input semantic="%s" source="#mesh-%s" offset="%d"%s/>\n'
+                                      % (semantic, name, offset, texcoord_set))
+
+                output_file.write('          <p>')
+
+                # index stream is built and written in chunks of triangles
+                separator = ''
+
+                for first in range(start, start + count, WRITE_CHUNK_SIZE):
+                    triangles = order[first:min(first + WRITE_CHUNK_SIZE, start + count)]
+                    stream = array('i', bytes(4 * 3 * len(indices) * len(triangles)))
+                    stride = 3 * len(indices)
+
+                    for corner in range(3):
+                        vertices = array('i', map((corner).__add__, map((3).__mul__, triangles)))
+
+                        for offset, vertex_indices in enumerate(indices):
+                            stream[corner * len(indices) + offset::stride] = array('i', map(vertex_indices.__getitem__, vertices))
+
+                    output_file.write(separator)
+                    output_file.write(' '.join(map(str, stream)))
+                    separator = ' '
+
+                output_file.write('</p>\n'
+                                  '        </triangles>\n')
+
+                start += count
+
+            output_file.write('      </mesh>\n'
+                              '    </geometry>\n'
+                              '  </library_geometries>\n'
+                              '  <library_visual_scenes>\n'
+                              '    <visual_scene id="scene" name="scene">\n'
+                              '      <node id="node" name="node">\n'
+                              '        <instance_geometry url="#mesh">\n'
+                              '          <bind_material>\n'
+                              '            <technique_common>\n')
+
+            for material_index in range(len(model.materials)):
+                if counts.get(material_index, 0) > 0:
+                    output_file.write('              <instance_material symbol="material-%d" target="#material-%d">\n'
+                                      '                <bind_vertex_input semantic="UVMap" input_semantic="TEXCOORD" input_set="0"/>\n'
+                                      '              </instance_material>\n'
+                                      % (material_index, material_index))
+
+            output_file.write('            </technique_common>\n'
+                              '          </bind_material>\n'
+                              '        </instance_geometry>\n'
+                              '      </node>\n'
+                              '    </visual_scene>\n'
+                              '  </library_visual_scenes>\n'
+                              '  <scene>\n'
+                              '    <instance_visual_scene url="#scene"/>\n'
+                              '  </scene>\n'
+                              '</COLLADA>\n')
 
         return True
 
 
+class ColladaReader:
+    """Builds model from events of incremental XML parser
+
+    Geometry of every mesh is converted as soon as its primitive ends and
+    source arrays are dropped at end of mesh. Materials are bound after the
+    whole document is read, because visual scenes usually come last.
+    """
+
+    def __init__(self, filename: str, model: geometry.ArrayModel):
+        self.filename = filename
+        self.model = model
+
+        # local names of open elements
+        self.path: list[str] = []
+
+        # float arrays, sources and vertices of current mesh
+        self.arrays: dict[str, array] = {}
+        self.sources: dict[str, tuple[str, int]] = {}
+        self.vertices: dict[str, list[tuple]] = {}
+        self.source_id: str = None
+
+        # inputs, index lists and polygon sizes of current primitive or vertices
+        self.inputs: list[tuple[str, str, int, int]] = []
+        self.indices: list[array] = []
+        self.vcount: array = None
+
+        # image id -> file name
+        self.images: dict[str, str] = {}
+        self.image_id: str = None
+
+        # effect id -> colors, texture and parameters of effect
+        self.effects: dict[str, dict] = {}
+        self.effect: dict = None
+        self.param_sid: str = None
+
+        # material id -> (name, effect id)
+        self.materials: dict[str, tuple[str, str]] = {}
+        self.material_id: str = None
+
+        # material symbol -> material id, from visual scenes
+        self.bindings: dict[str, str] = {}
+
+        # material symbols used by primitives and symbol index of every triangle
+        self.symbols: dict[str, int] = {}
+        self.symbol_indices = array('i')
+
+    def parent(self) -> str:
+        if len(self.path) == 0:
+            return None
+
+        return self.path[-1]
+
+    def start(self, tag: str, element: ElementTree.Element) -> None:
+        parent = self.parent()
+
+        if tag == 'source' and parent == 'mesh':
+            self.source_id = element.get('id')
+        elif tag == 'image':
+            self.image_id = element.get('id')
+        elif tag == 'effect':
+            self.effect = {'colors': {}, 'texture': None, 'texture2': '', 'lod': 0, 'surfaces': {}, 'samplers': {}}
+            self.effects[element.get('id')] = self.effect
+        elif tag == 'newparam':
+            self.param_sid = element.get('sid')
+        elif tag == 'material' and parent == 'library_materials':
+            self.material_id = element.get('id')
+            self.materials[self.material_id] = (element.get('name') or self.material_id, None)
+
+    def end(self, tag: str, element: ElementTree.Element) -> None:
+        parent = self.parent()
+        text = element.text or ''
+
+        # geometry
+        if tag == 'float_array' and self.source_id is not None:
+            self.arrays[element.get('id')] = parse_numbers(text, 'd', float)
+        elif tag == 'accessor' and self.source_id is not None:
+            self.sources[self.source_id] = (element.get('source').lstrip('#'), int(element.get('stride', '1')))
+        elif tag == 'source' and parent == 'mesh':
+            self.source_id = None
+        elif tag == 'input' and (parent == 'vertices' or parent in PRIMITIVES):
+            self.inputs.append((element.get('semantic'), element.get('source').lstrip('#'),
+                                int(element.get('offset', '0')), int(element.get('set', '0'))))
+        elif tag == 'vertices':
+            self.vertices[element.get('id')] = self.inputs
+            self.inputs = []
+        elif tag == 'vcount':
+            self.vcount = parse_numbers(text, 'i', int)
+        elif tag == 'p' and parent in PRIMITIVES:
+            self.indices.append(parse_numbers(text, 'i', int))
+        elif tag in PRIMITIVES:
+            with profiling.span('read.collada.primitives'):
+                self.add_primitive(tag, element.get('material', ''))
+
+            self.inputs = []
+            self.indices = []
+            self.vcount = None
+        elif tag == 'mesh':
+            self.arrays.clear()
+            self.sources.clear()
+            self.vertices.clear()
+
+        # materials
+        elif tag == 'init_from' and parent == 'surface':
+            self.effect['surfaces'][self.param_sid] = text.strip()
+        elif tag in ('init_from', 'ref') and 'image' in self.path[-2:]:
+            self.images[self.image_id] = text.strip()
+        elif tag == 'source' and parent == 'sampler2D':
+            self.effect['samplers'][self.param_sid] = text.strip()
+        elif tag == 'instance_image' and parent == 'sampler2D':
+            self.effect['samplers'][self.param_sid] = element.get('url').lstrip('#')
+        elif tag == 'color' and parent in ('ambient', 'diffuse', 'specular') and self.effect is not None:
+            self.effect['colors'][parent] = list(map(float, text.split()))
+        elif tag == 'texture' and parent == 'diffuse' and self.effect is not None:
+            self.effect['texture'] = element.get('texture')
+        elif tag == 'texture2' and parent == 'technique' and self.effect is not None:
+            self.effect['texture2'] = text.strip()
+        elif tag == 'lod_level' and parent == 'technique' and self.effect is not None:
+            self.effect['lod'] = int(text)
+        elif tag == 'effect':
+            self.effect = None
+        elif tag == 'instance_effect' and parent == 'material':
+            name = self.materials[self.material_id][0]
+            self.materials[self.material_id] = (name, element.get('url').lstrip('#'))
+        elif tag == 'instance_material':
+            self.bindings[element.get('symbol')] = element.get('target').lstrip('#')
+
+    def add_primitive(self, tag: str, symbol: str) -> None:
+        # inputs of vertices element share offset of VERTEX input
+        inputs = []
+
+        for semantic, source, offset, texcoord_set in self.inputs:
+            if semantic == 'VERTEX':
+                inputs.extend((name, vertex_source, offset, vertex_set)
+                              for name, vertex_source, _, vertex_set in self.vertices[source])
+            else:
+                inputs.append((semantic, source, offset, texcoord_set))
+
+        if len(inputs) == 0 or len(self.indices) == 0:
+            return
+
+        stride = max(offset for _, _, offset, _ in inputs) + 1
+
+        if tag == 'polygons':
+            sizes = array('i', (len(indices) // stride for indices in self.indices))
+            indices = array('i')
+
+            for polygon in self.indices:
+                indices.extend(polygon[:len(polygon) // stride * stride])
+        else:
+            indices = self.indices[0]
+
+            if tag == 'polylist':
+                sizes = self.vcount
+            else:
+                sizes = None
+
+        corner_count = len(indices) // stride
+
+        if sizes is not None:
+            if sum(sizes) != corner_count:
+                raise IndexError(f'{tag} has {corner_count} vertices, expected {sum(sizes)}')
+
+            corners, _ = geometry.triangulate_polygons(sizes)
+        else:
+            corners = None
+
+        if corners is None:
+            corner_count -= corner_count % 3
+        else:
+            corner_count = len(corners)
+
+        triangle_count = corner_count // 3
+
+        # texture coordinate sets are assigned to tex1 and tex2 in order of set number
+        texcoord_sets = sorted({texcoord_set for semantic, _, _, texcoord_set in inputs if semantic == 'TEXCOORD'})
+        filled = set()
+
+        for semantic, source, offset, texcoord_set in inputs:
+            if semantic == 'TEXCOORD':
+                position = texcoord_sets.index(texcoord_set)
+
+                if position >= len(TEXCOORD_BUFFERS):
+                    continue
+
+                name, size, flip = TEXCOORD_BUFFERS[position], 2, True
+            elif semantic in SEMANTICS:
+                name, size, flip = SEMANTICS[semantic]
+            else:
+                continue
+
+            if name in filled:
+                continue
+
+            corner_indices = indices[offset:offset + stride * corner_count:stride] if corners is None else \
+                array('i', map(indices[offset::stride].__getitem__, corners))
+
+            array_id, source_stride = self.sources[source]
+            gather(getattr(self.model, name), self.arrays[array_id], source_stride, corner_indices, size, flip)
+            filled.add(name)
+
+        # attributes missing in primitive are zero
+        for name, size in (('positions', 9), ('normals', 9), ('tex1', 6), ('tex2', 6)):
+            if name not in filled:
+                buffer = getattr(self.model, name)
+                buffer.extend(array(buffer.typecode, bytes(buffer.itemsize * size * triangle_count)))
+
+        symbol_index = self.symbols.setdefault(symbol, len(self.symbols))
+        self.symbol_indices.extend(array('i', [symbol_index]) * triangle_count)
+
+    def finish(self, default_texture: str) -> None:
+        """Adds materials bound to used symbols"""
+        remap = [0] * len(self.symbols)
+
+        for symbol, index in self.symbols.items():
+            remap[index] = self.model.add_material(self.make_material(symbol, default_texture))
+
+        self.model.material_indices.extend(map(remap.__getitem__, self.symbol_indices))
+
+    def make_material(self, symbol: str, default_texture: str) -> geometry.Material:
+        material = geometry.Material()
+
+        material_id = self.bindings.get(symbol, symbol)
+        name, effect_id = self.materials.get(material_id, (material_id, None))
+
+        match = state_pattern.match(name)
+
+        if match is not None:
+            material.state = geometry.encode_state(match.group(2))
+
+        effect = self.effects.get(effect_id)
+
+        if effect is not None:
+            for color_name, values in effect['colors'].items():
+                setattr(material, color_name, (values + [0.0] * 4)[:4])
+
+            material.texture2 = effect['texture2']
+            material.lod = effect['lod']
+
+            texture = effect['texture']
+
+            if texture is not None:
+                # texture refers to sampler, sampler to surface and surface to image
+                texture = effect['samplers'].get(texture, texture)
+                texture = effect['surfaces'].get(texture, texture)
+                texture = self.images.get(texture, texture)
+
+                path = urllib.parse.unquote(urllib.parse.urlparse(texture.replace('\\', '/')).path)
+                material.texture1 = os.path.basename(path)
+
+        if material.texture1 == '':
+            material.texture1 = default_texture
+
+        return material
+
+
+# converts whitespace separated list of numbers to array block by block,
+# so tokens of whole list are never held at once
+def parse_numbers(text: str, typecode: str, convert) -> array:
+    result = array(typecode)
+    start = 0
+
+    while start < len(text):
+        match = whitespace_pattern.search(text, start + NUMBER_BLOCK_SIZE)
+        end = len(text) if match is None else match.end()
+
+        result.extend(map(convert, text[start:end].split()))
+        start = end
+
+    return result
+
+
+# gathers attribute of given source for corner indices into buffer,
+# only first size components of every source element are used
+def gather(buffer: array, values: array, stride: int, indices: array, size: int, flip: bool) -> None:
+    count = len(values) // stride
+
+    if len(indices) > 0 and (max(indices) >= count or min(indices) < 0):
+        raise IndexError(f'vertex index out of range of {count} elements')
+
+    first = len(buffer)
+    buffer.extend(array(buffer.typecode, bytes(buffer.itemsize * size * len(indices))))
+
+    # components missing in source stay zero
+    for component in range(min(size, stride)):
+        column = values[component::stride]
+
+        # texture v coordinate goes up in COLLADA and down in Colobot
+        if flip and component == 1:
+            column = array(values.typecode, map((1.0).__sub__, column))
+
+        buffer[first + component::size] = array(buffer.typecode, map(column.__getitem__, indices))
+
+
+# finds unique elements of attribute buffer with given number of components,
+# returns their values and index of unique element for every vertex
+def index_attribute(buffer: array, size: int, flip: bool) -> tuple[array, array]:
+    index: dict[tuple, int] = {}
+    values = array(buffer.typecode)
+    indices = array('i')
+
+    count = len(buffer) // size
+
+    for first in range(0, count, WRITE_CHUNK_SIZE):
+        last = min(first + WRITE_CHUNK_SIZE, count)
+        columns = [buffer[size * first + component:size * last:size] for component in range(size)]
+
+        # texture v coordinate goes up in COLLADA and down in Colobot
+        if flip:
+            columns[1] = map((1.0).__sub__, columns[1])
+
+        keys = list(zip(*columns))
+
+        added = [key for key in dict.fromkeys(keys) if key not in index]
+        index.update(zip(added, range(len(index), len(index) + len(added))))
+        values.extend(itertools.chain.from_iterable(added))
+
+        indices.extend(map(index.__getitem__, keys))
+
+    return values, indices
+
+
+# writes numbers separated by spaces, formatted in chunks
+def write_numbers(output_file, values: array, formatter) -> None:
+    for first in range(0, len(values), WRITE_CHUNK_SIZE):
+        if first > 0:
+            output_file.write(' ')
+
+        output_file.write(' '.join(map(formatter, values[first:first + WRITE_CHUNK_SIZE])))
+
+
+# writes images, effects and materials libraries
+def write_materials(output_file, materials: list[geometry.Material]) -> None:
+    # one image per distinct texture
+    images: dict[str, int] = {}
+
+    for mat in materials:
+        if mat.texture1 != '' and mat.texture1 not in images:
+            images[mat.texture1] = len(images)
+
+    if len(images) > 0:
+        output_file.write('  <library_images>\n')
+
+        for texture, index in images.items():
+            output_file.write('    <image id="image-%d" name=%s>\n'
+                              '      <init_from>%s</init_from>\n'
+                              '    </image>\n'
+                              % (index, quoteattr(texture), escape(urllib.parse.quote(texture))))
+
+        output_file.write('  </library_images>\n')
+
+    output_file.write('  <library_effects>\n')
+
+    for index, mat in enumerate(materials):
+        output_file.write('    <effect id="effect-%d">\n'
+                          '      <profile_COMMON>\n' % index)
+
+        if mat.texture1 != '':
+            output_file.write('        <newparam sid="surface-%d">\n'
+                              '          <surface type="2D">\n'
+                              '            <init_from>image-%d</init_from>\n'
+                              '          </surface>\n'
+                              '        </newparam>\n'
+                              '        <newparam sid="sampler-%d">\n'
+                              '          <sampler2D>\n'
+                              '            <source>surface-%d</source>\n'
+                              '          </sampler2D>\n'
+                              '        </newparam>\n'
+                              % (index, images[mat.texture1], index, index))
+
+            diffuse = '<texture texture="sampler-%d" texcoord="UVMap"/>' % index
+        else:
+            diffuse = '<color>%s</color>' % ' '.join(map(repr, mat.diffuse))
+
+        output_file.write('        <technique sid="common">\n'
+                          '          <phong>\n'
+                          '            <ambient><color>%s</color></ambient>\n'
+                          '            <diffuse>%s</diffuse>\n'
+                          '            <specular><color>%s</color></specular>\n'
+                          '          </phong>\n'
+                          '        </technique>\n'
+                          % (' '.join(map(repr, mat.ambient)), diffuse, ' '.join(map(repr, mat.specular))))
+
+        # diffuse holds either texture or color, so color of textured material,
+        # second texture and level of detail are kept in Colobot extra technique
+        if mat.texture1 != '' or mat.texture2 != '' or mat.lod != 0:
+            output_file.write('        <extra>\n'
+                              '          <technique profile="COLOBOT">\n'
+                              '            <diffuse><color>%s</color></diffuse>\n'
+                              '            <texture2>%s</texture2>\n'
+                              '            <lod_level>%d</lod_level>\n'
+                              '          </technique>\n'
+                              '        </extra>\n'
+                              % (' '.join(map(repr, mat.diffuse)), escape(mat.texture2), mat.lod))
+
+        output_file.write('      </profile_COMMON>\n'
+                          '    </effect>\n')
+
+    output_file.write('  </library_effects>\n'
+                      '  <library_materials>\n')
+
+    for index, mat in enumerate(materials):
+        name = 'Material_%d_[%s]' % (index + 1, geometry.decode_state(mat.state))
+
+        output_file.write('    <material id="material-%d" name=%s>\n'
+                          '      <instance_effect url="#effect-%d"/>\n'
+                          '    </material>\n'
+                          % (index, quoteattr(name), index))
+
+    output_file.write('  </library_materials>\n')
+
+
 register_format('collada', COLLADAFormat())
 register_extension('dae', 'collada')
@@ -2,88 +2,158 @@
 # Implements Colobot model formats
 # Copyright (c) 2014 Tomasz Kapuściński
 
+import os
+from array import array
+from operator import itemgetter
+
 import geometry
 import modelformats
+import profiling
+
+# line type codes, p1-p3 map to vertex index
+LINE_MAT = 3
+LINE_TEX1 = 4
+LINE_TEX2 = 5
+LINE_STATE = 6
+LINE_LOD = 7
+LINE_VERSION = 8
+LINE_TOTAL = 9
+
+line_codes: dict[str, int] = {
+    'p1': 0,
+    'p2': 1,
+    'p3': 2,
+    'mat': LINE_MAT,
+    'tex1': LINE_TEX1,
+    'tex2': LINE_TEX2,
+    'state': LINE_STATE,
+    'lod_level': LINE_LOD,
+    'version': LINE_VERSION,
+    'total_triangles': LINE_TOTAL,
+}
+
+# coordinate, normal and texture coordinate fields of vertex line
+vertex_fields = itemgetter(2, 3, 4, 6, 7, 8, 10, 11, 13, 14)
+
+ZERO_TOKENS = ['0'] * 30
+
+# text of one triangle with shortest values: three vertex lines and state line
+MIN_TRIANGLE_SIZE = 3 * len('p1 c 0 0 0 n 0 0 0 t1 0 0 t2 0 0\n') + len('state 0\n')
+
+# triangle written by writer: 3 vertices of 10 fields and material lines
+triangle_template = ''.join(
+    'p%d c %%f %%f %%f'
+    ' n %%f %%f %%f'
+    ' t1 %%f %%f'
+    ' t2 %%f %%f\n' % (i+1) for i in range(3)) + '%s'
+
+TRIANGLE_ARGS = 31
+
+# number of triangles formatted at once
+CHUNK_SIZE = 4096
 
 
 class ColobotNewTextFormat(modelformats.ModelFormat):
     description: str = 'Colobot New Text format'
     ext: str = 'txt'
 
-    def read(self, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
-        input_file = open(filename, 'r', encoding='utf8')
+    reads_arrays: bool = True
+    writes_arrays: bool = True
+    array_typecode: str = 'd'
 
-        triangle = geometry.Triangle()
-        materials: list[geometry.Material] = []
+    def read_arrays(self, filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> bool:
+        floats = array(model.typecode)
+        count = 0
 
-        while True:
-            line = input_file.readline()
+        material_indices = array('i')
+        materials: dict[tuple, int] = {}
+        header: dict[str, int] = {}
 
-            # eof
-            if not line:
-                break
+        with profiling.span('read.new_txt.parse'), open(filename, 'r', encoding='utf8') as input_file:
+            for tokens, keys in iter_triangle_chunks(input_file, header):
+                # header precedes triangles, its declared count presizes storage
+                if count == 0 and 'total_triangles' in header:
+                    total = presize_count(header['total_triangles'], filename)
+                    floats = array(model.typecode, bytes(floats.itemsize * 30 * total))
+                    material_indices = array('i', bytes(material_indices.itemsize * total))
 
-            # comments are ignored
-            if line[0] == '#':
-                continue
+                indices = array('i')
 
-            # remove eol
-            if line[-1] == '\n':
-                line = line[:-1]
+                for key in keys:
+                    index = materials.get(key)
 
-            values = line.split(' ')
-            cmd = values[0]
+                    if index is None:
+                        index = model.add_material(make_material(*key))
+                        materials[key] = index
 
-            if cmd == 'version':
-                model.version = int(values[1])
-            elif cmd == 'triangles':
-                continue
-            elif cmd == 'p1':
-                triangle.vertices[0] = modelformats.parse_vertex(values)
-            elif cmd == 'p2':
-                triangle.vertices[1] = modelformats.parse_vertex(values)
-            elif cmd == 'p3':
-                triangle.vertices[2] = modelformats.parse_vertex(values)
-            elif cmd == 'mat':
-                triangle.material = modelformats.parse_material(values)
-            elif cmd == 'tex1':
-                triangle.material.texture1 = values[1]
-            elif cmd == 'tex2':
-                triangle.material.texture2 = values[1]
-            elif cmd == 'var_tex2':
-                continue
-            elif cmd == 'lod_level':
-                triangle.material.lod = int(values[1])
-            elif cmd == 'state':
-                triangle.material.state = int(values[1])
+                    indices.append(index)
 
-                mat_final: geometry.Material = None
+                # slices past presized end extend storage
+                floats[30 * count:30 * (count + len(keys))] = array(model.typecode, map(float, tokens))
+                material_indices[count:count + len(keys)] = indices
+                count += len(keys)
 
-                for mat in materials:
-                    if triangle.material == mat:
-                        mat_final = mat
+        # declared count may be larger than actual one
+        del floats[30 * count:]
+        del material_indices[count:]
 
-                if mat_final is None:
-                    mat_final = triangle.material
-                    materials.append(mat_final)
+        if 'version' in header:
+            model.version = header['version']
 
-                triangle.material = mat_final
+        # scatter fields into model buffers
+        with profiling.span('read.new_txt.scatter'):
+            for buffer, offsets in ((model.positions, (0, 1, 2)), (model.normals, (3, 4, 5)),
+                                    (model.tex1, (6, 7)), (model.tex2, (8, 9))):
+                size = len(offsets)
+                stride = 3 * size
+                first = len(buffer)
+                buffer.extend(array(buffer.typecode, bytes(buffer.itemsize * stride * count)))
 
-                model.triangles.append(triangle)
-                triangle = geometry.Triangle()
+                for vertex in range(3):
+                    for component, offset in enumerate(offsets):
+                        buffer[first + vertex * size + component::stride] = floats[10 * vertex + offset::30]
 
-        input_file.close()
+        model.material_indices.extend(material_indices)
 
         return True
 
-    def write(self, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
-        output_file = open(filename, 'w', encoding='utf8')
-
+    def write_arrays(self, filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> bool:
         version = 2
 
         if 'version' in params:
             version = int(params['version'])
 
+        dirt = 'N'
+
+        if 'dirt' in params:
+            dirt = 'Y'
+
+        # lower levels of detail are generated from the model
+        if 'lod' in params:
+            if version != 1:
+                print('Levels of detail are supported only by format version 1')
+                return False
+
+            ratios = geometry.LOD_RATIOS
+
+            if params['lod'] != 'none':
+                try:
+                    ratios = tuple(float(value) for value in params['lod'].split(','))
+                except ValueError:
+                    ratios = ()
+
+                if not 1 <= len(ratios) <= 2 or not all(0.0 < ratio <= 1.0 for ratio in ratios):
+                    print(f'Invalid levels of detail: {params["lod"]}')
+                    return False
+
+            with profiling.span('write.new_txt.lod'):
+                model = geometry.generate_lods(model, ratios)
+
+        # material lines, formatted once per material
+        material_lines = [format_material(mat, dirt, version) for mat in model.materials]
+
+        output_file = open(filename, 'w', encoding='utf8', buffering=CHUNK_SIZE * 1024)
+
         # write header
         output_file.write('# Colobot text model\n'
                           '\n'
@@ -92,49 +162,128 @@ class ColobotNewTextFormat(modelformats.ModelFormat):
                           'total_triangles %d\n'
                           '\n'
                           '### TRIANGLES\n'
-                          % (version, len(model.triangles)))
-
-        # write triangles
-        for triangle in model.triangles:
-            # write vertices
-            for i in range(3):
-                vertex = triangle.vertices[i]
-                output_file.write(
-                    'p%d c %f %f %f'
-                    ' n %f %f %f'
-                    ' t1 %f %f'
-                    ' t2 %f %f\n'
-                    % (i+1, *vertex.coord, *vertex.normal, *vertex.tex1, *vertex.tex2))
-
-            mat = triangle.material
-
-            dirt = 'N'
-            dirt_texture = ''
-
-            if 'dirt' in params:
-                dirt = 'Y'
-                dirt_texture = params['dirt']
-
-            output_file.write(
-                'mat dif %f %f %f %f'
-                ' amb %f %f %f %f'
-                ' spc %f %f %f %f\n'
-                'tex1 %s\n'
-                'tex2 %s\n'
-                'var_tex2 %c\n'
-                % (*mat.diffuse, *mat.ambient, *mat.specular,
-                    mat.texture1, mat.texture2, dirt))
-
-            if version == 1:
-                output_file.write('lod_level 0\n')
-
-            output_file.write('state %d\n\n' % mat.state)
+                          % (version, len(model)))
+
+        # write triangles in chunks, each formatted with one template
+        for first in range(0, len(model), CHUNK_SIZE):
+            last = min(first + CHUNK_SIZE, len(model))
+            count = last - first
+
+            with profiling.span('write.new_txt.format'):
+                args = [None] * (TRIANGLE_ARGS * count)
+
+                for buffer, offset, size in ((model.positions, 0, 3), (model.normals, 3, 3),
+                                             (model.tex1, 6, 2), (model.tex2, 8, 2)):
+                    stride = 3 * size
+
+                    for vertex in range(3):
+                        for component in range(size):
+                            start = first * stride + vertex * size + component
+                            args[10 * vertex + offset + component::TRIANGLE_ARGS] = buffer[start:last * stride:stride]
+
+                args[30::TRIANGLE_ARGS] = [material_lines[i] for i in model.material_indices[first:last]]
+
+                text = (triangle_template * count) % tuple(args)
+
+            with profiling.span('write.new_txt.io'):
+                output_file.write(text)
 
         output_file.close()
 
         return True
 
 
+# returns declared triangle count limited by number of triangles that fit in file
+def presize_count(declared: int, filename: str) -> int:
+    return max(0, min(declared, os.path.getsize(filename) // MIN_TRIANGLE_SIZE))
+
+
+# parses triangles of text model in chunks, yields numeric vertex fields of
+# chunk, 30 per triangle, and material key of every triangle for make_material,
+# version and declared triangle count are stored in header
+def iter_triangle_chunks(input_file, header: dict[str, int], chunk_size: int = CHUNK_SIZE):
+    tokens = ZERO_TOKENS * chunk_size
+    keys: list[tuple] = []
+
+    # material lines of current triangle
+    mat = None
+    tex1 = ''
+    tex2 = ''
+    lod = 0
+
+    for lines in modelformats.iter_line_blocks(input_file):
+        for line in lines:
+            values = line.split(' ')
+            code = line_codes.get(values[0])
+
+            if code is None:
+                # comments, empty and unknown lines are ignored
+                continue
+            elif code < 3:
+                start = 30 * len(keys) + 10 * code
+                tokens[start:start+10] = vertex_fields(values)
+            elif code == LINE_MAT:
+                mat = line
+            elif code == LINE_TEX1:
+                tex1 = values[1]
+            elif code == LINE_TEX2:
+                tex2 = values[1]
+            elif code == LINE_STATE:
+                keys.append((mat, tex1, tex2, lod, values[1]))
+
+                mat = None
+                tex1 = ''
+                tex2 = ''
+                lod = 0
+
+                if len(keys) == chunk_size:
+                    yield tokens, keys
+
+                    tokens = ZERO_TOKENS * chunk_size
+                    keys = []
+            elif code == LINE_LOD:
+                lod = int(values[1])
+            elif code == LINE_VERSION:
+                header['version'] = int(values[1])
+            elif code == LINE_TOTAL:
+                header['total_triangles'] = int(values[1])
+
+    if len(keys) > 0:
+        yield tokens[:30 * len(keys)], keys
+
+
+# formats material lines of one triangle
+def format_material(mat: geometry.Material, dirt: str, version: int) -> str:
+    text = ('mat dif %f %f %f %f'
+            ' amb %f %f %f %f'
+            ' spc %f %f %f %f\n'
+            'tex1 %s\n'
+            'tex2 %s\n'
+            'var_tex2 %c\n'
+            % (*mat.diffuse, *mat.ambient, *mat.specular,
+               mat.texture1, mat.texture2, dirt))
+
+    if version == 1:
+        text += 'lod_level %d\n' % mat.lod
+
+    return text + 'state %d\n\n' % mat.state
+
+
+# creates material from lines of one triangle
+def make_material(mat: str, tex1: str, tex2: str, lod: int, state: str) -> geometry.Material:
+    if mat is None:
+        material = geometry.Material()
+    else:
+        material = modelformats.parse_material(mat.split(' '))
+
+    material.texture1 = tex1
+    material.texture2 = tex2
+    material.lod = lod
+    material.state = int(state)
+
+    return material
+
+
 modelformats.register_format('new_txt', ColobotNewTextFormat())
 
 modelformats.register_extension('txt', 'new_txt')
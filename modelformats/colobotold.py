@@ -1,142 +1,180 @@
 import struct
+from array import array
 
 import geometry
-from geometry.texcoord import TexCoord
-from geometry.vector3d import Vector3D
-from modelformats import ModelFormat, register_format, register_extension
+import profiling
+from modelformats import ModelFormat, get_param, register_format, register_extension
+
+# file header: version major, version minor, triangle count, padding
+HEADER = struct.Struct('=iii40x')
+
+# v1.2 triangle record: used, selected, padding, 3 vertices of 10 floats,
+# diffuse, ambient and specular colors, emissive color and power,
+# texture name, rendering range, state, dirt texture, reserved
+RECORD = struct.Struct('=4x30f12f20x20s8xiH6x')
+
+# material part of triangle record
+RECORD_MATERIAL = struct.Struct('=124x12f20x20s8xiH6x')
+
+# material part of triangle record as written, emissive color and power
+# are zeroed, rendering range is fixed
+RECORD_MATERIAL_TAIL = struct.Struct('=12f20x20sffiH6x')
+
+# offset and stride of vertex data within record, counted in floats
+RECORD_FLOATS = RECORD.size // 4
+VERTEX_OFFSET = 1
+VERTEX_FLOATS = 10
+
+# model buffer, offset within vertex data and component count
+VERTEX_ATTRIBUTES = (('positions', 0, 3), ('normals', 3, 3), ('tex1', 6, 2), ('tex2', 8, 2))
+
 
 class ColobotOldFormat(ModelFormat):
     description: str = 'Colobot Old Binary format'
     ext: str = 'mod'
+    reads_arrays: bool = True
+    writes_arrays: bool = True
 
-    def read(self, filename, model, params):
-        input_file = open(filename, 'rb')
+    def read_arrays(self, filename, model, params):
+        with profiling.span('read.old.io'), open(filename, 'rb') as input_file:
+            data = input_file.read()
 
-        # read header
-        version_major = struct.unpack('=i', input_file.read(4))[0]
-        version_minor = struct.unpack('=i', input_file.read(4))[0]
+        if len(data) < HEADER.size:
+            print(f'File {filename} is too short')
+            return False
 
-        triangle_count = struct.unpack('=i', input_file.read(4))[0]
+        # read header
+        version_major, version_minor, triangle_count = HEADER.unpack_from(data)
 
         if version_major != 1 or version_minor != 2:
             print(f'Unsupported format version: {version_major}.{version_minor}')
             return False
 
-        # read and ignore padding
-        input_file.read(40)
+        end = HEADER.size + triangle_count * RECORD.size
 
-        materials = []
+        if len(data) < end:
+            print(f'File {filename} is truncated')
+            return False
 
-        for index in range(triangle_count):
-            triangle = geometry.Triangle()
+        records = memoryview(data)[HEADER.size:end]
 
-            # used, selected, 2 byte padding
-            input_file.read(4)
+        # scatter vertex attributes from records into model buffers
+        with profiling.span('read.old.vertices'):
+            floats = array('f')
+            floats.frombytes(records)
 
-            for vertex in triangle.vertices:
-                # position, normal, uvs
-                floats = struct.unpack('=ffffffffff', input_file.read(4 * 10))
+            for name, offset, size in VERTEX_ATTRIBUTES:
+                buffer = getattr(model, name)
+                stride = 3 * size
+                first = len(buffer)
+                buffer.extend(array(buffer.typecode, bytes(buffer.itemsize * stride * triangle_count)))
 
-                vertex.coord = Vector3D(*floats[0:3])
-                vertex.normal = Vector3D(*floats[3:6])
-                vertex.tex1 = TexCoord(*floats[6:8])
-                vertex.tex2 = TexCoord(*floats[8:10])
+                for vertex in range(3):
+                    for component in range(size):
+                        start = VERTEX_OFFSET + vertex * VERTEX_FLOATS + offset + component
+                        column = floats[start::RECORD_FLOATS]
 
-            # material colors
-            floats = struct.unpack('=fffffffffffffffff', input_file.read(4 * 17))
+                        if buffer.typecode != column.typecode:
+                            column = array(buffer.typecode, column)
 
-            mat = triangle.material
+                        buffer[first + vertex * size + component::stride] = column
 
-            for i in range(4):
-                mat.diffuse[i] = floats[0 + i]
-                mat.ambient[i] = floats[4 + i]
-                mat.specular[i] = floats[8 + i]
+        # materials, decoded once per distinct record
+        with profiling.span('read.old.materials'):
+            material_indices: dict[tuple, int] = {}
+            indices = array('i', bytes(4 * triangle_count))
 
-            # texture name
-            chars = input_file.read(20)
+            for index, values in enumerate(RECORD_MATERIAL.iter_unpack(records)):
+                material_index = material_indices.get(values)
 
-            for i in range(20):
-                if chars[i] == '\0':
-                    mat.texture1 = struct.unpack(f'={i}s', chars[:i])[0]
-                    break
+                if material_index is None:
+                    material_index = model.add_material(decode_material(values))
+                    material_indices[values] = material_index
 
-            values = struct.unpack('=ffiHHHH', input_file.read(20))
+                indices[index] = material_index
 
-            mat.state = values[2]
-            dirt = values[3]
+        model.material_indices.extend(indices)
 
-            if dirt != 0:
-                mat.texture2 = f'dirty{dirt:02d}.png'
+        return True
 
-            # optimizing materials
-            replaced = False
+    def write_arrays(self, filename, model, params):
+        dirt = int(get_param(params, 'dirt', '0'))
 
-            for material in materials:
-                if mat == material:
-                    triangle.material = material
-                    replaced = True
-                    break
+        triangle_count = len(model)
 
-            if not replaced:
-                materials.append(mat)
+        output = bytearray(HEADER.size + triangle_count * RECORD.size)
+        HEADER.pack_into(output, 0, 1, 2, triangle_count)
 
-            model.triangles.append(triangle)
-            # end of triangle
+        records = memoryview(output)[HEADER.size:]
 
-        input_file.close()
+        # used flag, selected flag and padding
+        records.cast('i')[0::RECORD_FLOATS] = array('i', [1]) * triangle_count
 
-        return True
+        # gather vertex attributes from model buffers into records
+        with profiling.span('write.old.vertices'):
+            floats = records.cast('f')
 
-    def write(self, filename, model, params):
-        output_file = open(filename, 'wb')
+            for name, offset, size in VERTEX_ATTRIBUTES:
+                buffer = getattr(model, name)
+                stride = 3 * size
 
-        # write header
-        output_file.write(b'\x01\x00\x00\x00'                      # version major
-                          b'\x02\x00\x00\x00')                      # version minor
-        output_file.write(struct.pack('i', len(model.triangles)))   # total triangles
+                for vertex in range(3):
+                    for component in range(size):
+                        start = VERTEX_OFFSET + vertex * VERTEX_FLOATS + offset + component
+                        column = buffer[vertex * size + component::stride]
 
-        # padding
-        output_file.write(b'\x00' * 40)
+                        if column.typecode != 'f':
+                            column = array('f', column)
 
-        # triangles
-        for triangle in model.triangles:
-            output_file.write(b'\x01'       # used
-                              b'\x00'       # selected ?
-                              b'\x00\x00')   # padding (2 bytes)
+                        floats[start::RECORD_FLOATS] = column
 
-            # write vertices
-            for vertex in triangle.vertices:
-                output_file.write(struct.pack('=fff', *vertex.coord))       # vertex coord
-                output_file.write(struct.pack('=fff', *vertex.normal))    # normal
-                output_file.write(struct.pack('=ff', *vertex.tex1))                # tex coord 1
-                output_file.write(struct.pack('=ff', *vertex.tex2))                # tex coord 2
+        # material part, packed once per material
+        with profiling.span('write.old.materials'):
+            tails = [encode_material(mat, dirt) for mat in model.materials]
 
-            # material info
-            mat = triangle.material
-            output_file.write(struct.pack('=ffff', *mat.diffuse))        # diffuse color
-            output_file.write(struct.pack('=ffff', *mat.ambient))        # ambient color
-            output_file.write(struct.pack('=ffff', *mat.specular))       # specular color
-            output_file.write(b'\x00' * 20)                              # emissive color and power
+            start = RECORD.size - RECORD_MATERIAL_TAIL.size
 
-            # texture name
-            output_file.write(mat.texture1.encode('utf-8'))
+            for material_index in model.material_indices:
+                records[start:start + RECORD_MATERIAL_TAIL.size] = tails[material_index]
+                start += RECORD.size
 
-            # texture name padding
-            output_file.write(b'\x00' * (20 - len(mat.texture1)))
+        with profiling.span('write.old.io'), open(filename, 'wb') as output_file:
+            output_file.write(output)
 
-            dirt = 0
+        return True
 
-            if 'dirt' in params:
-                dirt = int(params['dirt'])
 
-            output_file.write(struct.pack('=ff', 0.0, 10000.0))     # rendering range
-            output_file.write(struct.pack('i', mat.state))          # state
-            output_file.write(struct.pack('=H', dirt))              # dirt texture
-            output_file.write(b'\x00' * 6)                          # reserved
+# creates material from material part of triangle record
+def decode_material(values: tuple) -> geometry.Material:
+    mat = geometry.Material()
 
-        output_file.close()
+    mat.diffuse = list(values[0:4])
+    mat.ambient = list(values[4:8])
+    mat.specular = list(values[8:12])
+
+    # texture name
+    name = values[12]
+    length = name.find(b'\0')
+
+    if length != -1:
+        name = name[:length]
+
+    mat.texture1 = name.decode('utf-8', 'replace')
+    mat.state = values[13]
+
+    dirt = values[14]
+
+    if dirt != 0:
+        mat.texture2 = f'dirty{dirt:02d}.png'
+
+    return mat
+
+
+# packs material part of triangle record
+def encode_material(mat: geometry.Material, dirt: int) -> bytes:
+    return RECORD_MATERIAL_TAIL.pack(*mat.diffuse, *mat.ambient, *mat.specular,
+                                     mat.texture1.encode('utf-8'), 0.0, 10000.0, mat.state, dirt)
 
-        return True
 
 register_format('colobot', ColobotOldFormat())
 register_format('old', ColobotOldFormat())
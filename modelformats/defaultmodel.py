@@ -11,25 +11,48 @@ class DefaultModelFormat(ModelFormat):
     description: str = 'Default model format'
     ext: str = ''
 
-    def read(self, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
+    def resolve(self, filename: str) -> ModelFormat:
         ext = get_extension(filename)
-        format = get_format_by_extension(ext)
+        return get_format_by_extension(ext)
+
+    # calls method of format chosen by filename extension
+    def delegate(self, method: str, filename: str, *args) -> bool:
+        fmt = self.resolve(filename)
 
-        if format is None:
+        if fmt is None:
             print(f'Unknown default format. File {filename} cannot be processed.')
             return False
 
-        return format.read(filename, model, params)
+        return getattr(fmt, method)(filename, *args)
+
+    def read(self, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
+        return self.delegate('read', filename, model, params)
 
     def write(self, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
-        ext = get_extension(filename)
-        fmt = get_format_by_extension(ext)
+        return self.delegate('write', filename, model, params)
+
+    def read_arrays(self, filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> bool:
+        return self.delegate('read_arrays', filename, model, params)
+
+    def write_arrays(self, filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> bool:
+        return self.delegate('write_arrays', filename, model, params)
 
+    def get_dependencies(self, filename: str, params: dict[str, str]) -> list[str]:
+        fmt = self.resolve(filename)
+
+        # unknown format is reported when file is read
         if fmt is None:
-            print(f'Unknown default format. File {filename} cannot be processed.')
-            return False
+            return []
+
+        return fmt.get_dependencies(filename, params)
+
+    def get_output_files(self, filename: str, params: dict[str, str]) -> list[str]:
+        fmt = self.resolve(filename)
+
+        if fmt is None:
+            return [filename]
 
-        return fmt.write(filename, model, params)
+        return fmt.get_output_files(filename, params)
 
 
 register_format('default', DefaultModelFormat())
\ No newline at end of file
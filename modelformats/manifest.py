@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Implements conversion manifest for incremental batch mode
+
+import hashlib
+import json
+import os
+
+
+# returns hex digest of file contents
+def file_digest(filename: str) -> str:
+    digest = hashlib.sha256()
+
+    with open(filename, 'rb') as input_file:
+        while True:
+            block = input_file.read(1 << 20)
+
+            if not block:
+                break
+
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Records finished conversions so unchanged files can be skipped
+
+    Entries are keyed by output path and remember input file stamp and hash,
+    stamps of files the input depends on, formats, parameters and converter
+    version together with output stamp and hash. Files whose size and mtime
+    did not change are not hashed again.
+    """
+
+    def __init__(self, filename: str, version: str):
+        self.filename = filename
+        self.version = version
+        self.entries: dict[str, dict] = {}
+
+        if os.path.exists(filename):
+            with open(filename, 'r', encoding='utf8') as input_file:
+                data = json.load(input_file)
+
+            if data.get('version') == 1:
+                self.entries = data['entries']
+
+    def save(self) -> None:
+        with open(self.filename, 'w', encoding='utf8') as output_file:
+            json.dump({'version': 1, 'entries': self.entries}, output_file, indent=1, sort_keys=True)
+
+    def settings(self, in_format: str, in_params: dict[str, str], out_format: str, out_params: dict[str, str]) -> dict:
+        return {
+            'in_format': in_format,
+            'in_params': in_params,
+            'out_format': out_format,
+            'out_params': out_params,
+            'converter': self.version,
+        }
+
+    def is_current(self, in_format: str, in_filename: str, in_params: dict[str, str], out_format: str, out_filename: str, out_params: dict[str, str],
+                   dependencies: list[str] = ()) -> bool:
+        """Checks if output is present and was made from same input and settings"""
+        entry = self.entries.get(os.path.abspath(out_filename))
+
+        if entry is None:
+            return False
+
+        if entry['input'] != os.path.abspath(in_filename):
+            return False
+
+        if entry['settings'] != self.settings(in_format, in_params, out_format, out_params):
+            return False
+
+        # dependencies must be the same files with the same contents, missing ones stay missing
+        recorded = entry.get('dependencies', {})
+
+        if sorted(recorded) != sorted(map(os.path.abspath, dependencies)):
+            return False
+
+        for path, dependency_stamp in recorded.items():
+            if dependency_stamp is None:
+                if os.path.exists(path):
+                    return False
+            elif not matches(dependency_stamp, path):
+                return False
+
+        return (matches(entry['input_stamp'], in_filename)
+                and matches(entry['output_stamp'], out_filename))
+
+    def update(self, in_format: str, in_filename: str, in_params: dict[str, str], out_format: str, out_filename: str, out_params: dict[str, str],
+               dependencies: list[str] = ()) -> None:
+        """Records finished conversion"""
+        self.entries[os.path.abspath(out_filename)] = {
+            'input': os.path.abspath(in_filename),
+            'input_stamp': stamp(in_filename),
+            'dependencies': {os.path.abspath(path): stamp(path) if os.path.isfile(path) else None for path in dependencies},
+            'settings': self.settings(in_format, in_params, out_format, out_params),
+            'output_stamp': stamp(out_filename),
+        }
+
+
+# returns size, mtime and hash of file
+def stamp(filename: str) -> dict:
+    stat = os.stat(filename)
+
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'hash': file_digest(filename),
+    }
+
+
+# checks if file still has recorded contents, hashing it only when size or mtime changed
+def matches(recorded: dict, filename: str) -> bool:
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return False
+
+    if stat.st_size != recorded['size']:
+        return False
+
+    if stat.st_mtime_ns == recorded['mtime']:
+        return True
+
+    if file_digest(filename) != recorded['hash']:
+        return False
+
+    recorded['mtime'] = stat.st_mtime_ns
+    return True
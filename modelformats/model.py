@@ -5,13 +5,56 @@ class ModelFormat:
     description: str
     ext: str
 
+    # formats that work directly on geometry.ArrayModel buffers override
+    # read_arrays/write_arrays and set these flags, read and write then
+    # convert triangles through buffers of array_typecode
+    reads_arrays: bool = False
+    writes_arrays: bool = False
+    array_typecode: str = 'f'
+
     def get_extension(self) -> str:
+        if getattr(self, 'ext', ''):
+            return self.ext
+
         return None
 
     def read(self, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
-        print('Reading not implemented')
-        return False
+        if not self.reads_arrays:
+            print('Reading not implemented')
+            return False
+
+        arrays = geometry.ArrayModel(self.array_typecode)
+
+        if not self.read_arrays(filename, arrays, params):
+            return False
+
+        arrays.to_model(model)
+        return True
 
     def write(self, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
-        print('Writing not implemented')
-        return False
\ No newline at end of file
+        if not self.writes_arrays:
+            print('Writing not implemented')
+            return False
+
+        return self.write_arrays(filename, geometry.ArrayModel.from_model(model, self.array_typecode), params)
+
+    # returns paths of other files whose contents change model read from given file
+    def get_dependencies(self, filename: str, params: dict[str, str]) -> list[str]:
+        return []
+
+    # returns paths of all files written when model is written to given file
+    def get_output_files(self, filename: str, params: dict[str, str]) -> list[str]:
+        return [filename]
+
+    def read_arrays(self, filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> bool:
+        triangles = geometry.Model()
+
+        if not self.read(filename, triangles, params):
+            return False
+
+        model.extend(triangles)
+        return True
+
+    def write_arrays(self, filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> bool:
+        # triangles are built on demand while format writes them
+        return self.write(filename, geometry.LazyModel(model), params)
@@ -2,26 +2,79 @@
 # Contains implementation of Wavefront .OBJ importer
 # Copyright (c) 2014 Tomasz Kapuściński
 
+import bisect
+import copy
+import itertools
+import mmap
+import os
 import re
+from array import array
 
 import modelformats
 import geometry
+import profiling
+
+# line type codes
+LINE_V = 0
+LINE_VT = 1
+LINE_VN = 2
+LINE_F = 3
+LINE_USEMTL = 4
+LINE_MTLLIB = 5
+
+line_codes: dict[str, int] = {
+    'v': LINE_V,
+    'vt': LINE_VT,
+    'vn': LINE_VN,
+    'f': LINE_F,
+    'usemtl': LINE_USEMTL,
+    'mtllib': LINE_MTLLIB,
+}
+
+# fields padding attribute lines with missing optional components
+ZERO_FIELDS = ['0', '0']
+
+# material library references, found without parsing the rest of file
+MTLLIB_PATTERN = re.compile(rb'(?:\A|\n)[ \t]*mtllib[ \t]+([^\r\n]*)')
+
+# files of this size or larger are read through memory map
+MMAP_THRESHOLD = 256 * 1024 * 1024
+
+# size of memory mapped file scanned at once, extended to end of line
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+
+# patterns for scanning memory mapped files, numeric fields are matched directly,
+# lines are found by preceding newline which is much faster than multiline mode
+VERTEX_PATTERN = re.compile(rb'\n[ \t]*v[ \t]+(\S+)[ \t]+(\S+)[ \t]+(\S+)')
+TEX_COORD_PATTERN = re.compile(rb'\n[ \t]*vt[ \t]+(\S+)(?:[ \t]+(\S+))?')
+NORMAL_PATTERN = re.compile(rb'\n[ \t]*vn[ \t]+(\S+)[ \t]+(\S+)[ \t]+(\S+)')
+ELEMENT_PATTERN = re.compile(rb'\n[ \t]*(f|usemtl|mtllib)[ \t]+([^\r\n]*)')
+
+# minimal and maximal number of consecutive faces converted in bulk
+BULK_FACE_COUNT = 16
+FACE_BATCH_SIZE = 4096
+
+# number of lines formatted at once by writer
+WRITE_CHUNK_SIZE = 1 << 14
+
+# face corner forms converted in bulk, attribute slots and pattern of whole list of corners
+FACE_LAYOUTS: dict[tuple[int, int], tuple[tuple[int, ...], re.Pattern]] = {
+    (0, 0): ((0,), re.compile(rb'\s*\d+(?:\s+\d+)*\s*')),
+    (1, 0): ((0, 1), re.compile(rb'\s*\d+/\d+(?:\s+\d+/\d+)*\s*')),
+    (2, 1): ((0, 2), re.compile(rb'\s*\d+//\d+(?:\s+\d+//\d+)*\s*')),
+    (2, 0): ((0, 1, 2), re.compile(rb'\s*\d+/\d+/\d+(?:\s+\d+/\d+/\d+)*\s*')),
+}
 
 
 class ObjFormat(modelformats.ModelFormat):
     description: str = 'Wavefront .OBJ format'
     ext: str = 'obj'
 
-    def read(self, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
-        # lists with parsed vertex attributes
-        vertex_coords: list[geometry.VertexCoord] = []
-        tex_coords: list[geometry.TexCoord] = []
-        normals: list[geometry.Normal] = []
-        materials: list[geometry.Material] = {}
-
-        # read file
-        input_file = open(filename, 'r', encoding='utf8')
+    reads_arrays: bool = True
+    writes_arrays: bool = True
+    array_typecode: str = 'd'
 
+    def read_arrays(self, filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> bool:
         flip_x = 1.0
         flip_y = 1.0
         flip_z = 1.0
@@ -37,73 +90,71 @@ class ObjFormat(modelformats.ModelFormat):
 
         flip_order = (flip_x * flip_y * flip_z) < 0
 
-        # parse lines
-        while True:
-            line = input_file.readline()
-
-            if len(line) == 0:
-                break
-
-            if line[len(line)-1] == '\n':
-                line = line[:len(line)-1]
+        reader = ObjReader(filename, model)
 
-            parts = line.split(' ')
+        # large files are scanned as bytes through memory map
+        use_mmap = modelformats.get_param(params, 'mmap') is not None or os.path.getsize(filename) >= MMAP_THRESHOLD
 
-            if parts[0] == 'mtllib':
-                name = parts[1]
-                materials = read_mtl_file(name)
-            elif parts[0] == 'v':
-                vertex_coords.append(geometry.VertexCoord(flip_x * float(parts[1]), flip_y * float(parts[2]), flip_z * float(parts[3])))
-            elif parts[0] == 'vt':
-                tex_coords.append(geometry.TexCoord(float(parts[1]), 1 - float(parts[2])))
-            elif parts[0] == 'vn':
-                normals.append(geometry.Normal(flip_x * float(parts[1]), flip_y * float(parts[2]), flip_z * float(parts[3])))
-            elif parts[0] == 'usemtl':
-                current_material = materials[parts[1]]
-            elif parts[0] == 'f':
-                polygon = []
+        # parse lines
+        with profiling.span('read.obj.parse'):
+            if use_mmap:
+                completed = reader.scan_bytes()
+            else:
+                completed = reader.scan_text()
 
-                # parse vertices
-                for i in range(1, len(parts)):
-                    elements = parts[i].split('/')
+        if not completed:
+            return False
 
-                    vert_coord = vertex_coords[int(elements[0]) - 1]
-                    normal = normals[int(elements[2]) - 1]
+        vertex_coord_indices = reader.vertex_coord_indices
+        tex_coord_indices = reader.tex_coord_indices
+        normal_indices = reader.normal_indices
+        polygon_materials = reader.polygon_materials
 
-                    if elements[1] == '':
-                        tex_coord = geometry.TexCoord(0.0, 0.0)
-                    else:
-                        tex_coord = tex_coords[int(elements[1]) - 1]
+        # triangulate polygons
+        corners, triangle_polygons = geometry.triangulate_polygons(reader.polygon_sizes, flip_order)
 
-                    polygon.append(geometry.Vertex(vert_coord, normal, tex_coord))
+        if corners is not None:
+            vertex_coord_indices = array('i', map(vertex_coord_indices.__getitem__, corners))
+            tex_coord_indices = array('i', map(tex_coord_indices.__getitem__, corners))
+            normal_indices = array('i', map(normal_indices.__getitem__, corners))
 
-                # triangulate polygon
-                new_triangles = geometry.triangulate(polygon, flip_order)
+        if triangle_polygons is not None:
+            polygon_materials = array('i', map(polygon_materials.__getitem__, triangle_polygons))
 
-                # save vertices
-                for triangle in new_triangles:
-                    triangle.material = current_material
-                    model.triangles.append(triangle)
+        # gather attributes of triangle corners into model buffers
+        try:
+            with profiling.span('read.obj.gather'):
+                gather(model.positions, reader.vertex_coords, vertex_coord_indices, (flip_x, flip_y, flip_z))
+                gather(model.tex1, reader.tex_coords, tex_coord_indices, (1.0, None))
+                gather(model.normals, reader.normals, normal_indices, (flip_x, flip_y, flip_z))
+        except IndexError:
+            print(f'Invalid vertex index in file {filename}')
+            return False
 
-        input_file.close()
+        model.tex2.extend(array(model.tex2.typecode, bytes(model.tex2.itemsize * 2 * len(vertex_coord_indices))))
+        model.material_indices.extend(polygon_materials)
 
         return True
 
-    def write(self, filename: str, model: geometry.Model, params: dict[str, str]) -> bool:
-        model_file = open(filename, 'w', encoding='utf8')
-        materials_filename = filename
+    def get_dependencies(self, filename: str, params: dict[str, str]) -> list[str]:
+        names = []
+
+        with open(filename, 'rb') as input_file:
+            # empty file cannot be mapped
+            if os.fstat(input_file.fileno()).st_size == 0:
+                return names
 
-        if materials_filename.find('.obj'):
-            materials_filename = materials_filename.replace('.obj', '.mtl')
+            with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                for match in MTLLIB_PATTERN.finditer(buffer):
+                    names.extend(match.group(1).decode('utf8').split())
 
-        materials_file = open(materials_filename, 'w', encoding='utf8')
+        return [resolve_mtl_path(name, filename) for name in names]
 
-        materials: list[geometry.Material] = []
-        vertex_coords: list[geometry.VertexCoord] = []
-        tex_coords: list[geometry.TexCoord] = []
-        normals: list[geometry.Normal] = []
+    def get_output_files(self, filename: str, params: dict[str, str]) -> list[str]:
+        return [filename, get_materials_filename(filename)]
 
-        faces: list[list[int, str]] = []
+    def write_arrays(self, filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> bool:
+        materials_filename = get_materials_filename(filename)
 
         flipX = 1.0
         flipY = 1.0
@@ -120,140 +171,455 @@ class ObjFormat(modelformats.ModelFormat):
 
         flipOrder = (flipX * flipY * flipZ) < 0
 
-        materials_file.write('# Materials\n')
+        tolerance = float(modelformats.get_param(params, 'tolerance', '0'))
 
-        for triangle in model.triangles:
-            mat = triangle.material
+        with profiling.span('write.obj.index'):
+            # exact duplicates are removed first, so every attribute is welded over unique vertices only
+            mesh = geometry.IndexedMesh.from_arrays(model)
 
-            if triangle.material not in materials:
-                materials.append(mat)
+            vertex_coords, vertex_coord_indices = geometry.weld([(mesh.positions, 3, tolerance)])
+            tex_coords, tex_coord_indices = geometry.weld([(mesh.tex1, 2, tolerance)])
+            normals, normal_indices = geometry.weld([(mesh.normals, 3, tolerance)])
 
-                name = 'Material_%d_[%s]' % (len(materials), geometry.decode_state(mat.state))
+            # face corners as v/vt/vn triples, counted from 1
+            stride = 9
+            faces = array('i', bytes(4 * stride * len(mesh)))
 
-                mat.name = name
-                materials_file.write('\nnewmtl %s\n' % name)
+            corners = [0, 1, 2]
 
-                if mat.texture1 != '':
-                    materials_file.write('map_Kd %s\n' % mat.texture1)
+            if flipOrder:
+                corners = [0, 2, 1]
 
-                materials_file.write(
-                    'Ns 96.078431\n'
-                    'Ka %f %f %f\n'
-                    'Kd %f %f %f\n'
-                    'Ks %f %f %f\n'
-                    'Ni 1.000000\n'
-                    'd 1.000000\n'
-                    'illum 2\n' 
-                    % (*mat.ambient[:3], *mat.diffuse[:3], *mat.specular[:3])
-                )
+            for slot, corner in enumerate(corners):
+                vertices = mesh.indices[corner::3]
 
-            else:
-                for mater in materials:
-                    if mat == mater:
-                        mat = mater
+                for offset, indices in enumerate((vertex_coord_indices, tex_coord_indices, normal_indices)):
+                    faces[3 * slot + offset::stride] = array('i', map((1).__add__, map(indices.__getitem__, vertices)))
+
+            # materials are named in order of first use
+            names: dict[int, str] = {}
 
-            face: list[list[int, str]] = []
+            for material_index in dict.fromkeys(mesh.material_indices):
+                mat = mesh.materials[material_index]
+                names[material_index] = 'Material_%d_[%s]' % (len(names) + 1, geometry.decode_state(mat.state))
 
-            for vertex in triangle.vertices:
-                vertex_coord = geometry.VertexCoord(*vertex.coord)
-                tex_coord = geometry.TexCoord(*vertex.tex1)
-                normal = geometry.Normal(*vertex.normal)
+        with profiling.span('write.obj.format'):
+            with open(materials_filename, 'w', encoding='utf8') as materials_file:
+                materials_file.write('# Materials\n')
 
-                # looking for vertex coordinate
-                vertex_coord_index = -1
+                for material_index, name in names.items():
+                    mat = mesh.materials[material_index]
 
-                for i in range(len(vertex_coords)):
-                    if vertex_coord == vertex_coords[i]:
-                        vertex_coord_index = i
+                    materials_file.write('\nnewmtl %s\n' % name)
 
-                if vertex_coord_index == -1:
-                    vertex_coord_index = len(vertex_coords)
-                    vertex_coords.append(vertex_coord)
+                    if mat.texture1 != '':
+                        materials_file.write('map_Kd %s\n' % mat.texture1)
 
-                # looking for texture coordinate
-                tex_coord_index = -1
+                    materials_file.write(
+                        'Ns 96.078431\n'
+                        'Ka %f %f %f\n'
+                        'Kd %f %f %f\n'
+                        'Ks %f %f %f\n'
+                        'Ni 1.000000\n'
+                        'd 1.000000\n'
+                        'illum 2\n'
+                        % (*mat.ambient[:3], *mat.diffuse[:3], *mat.specular[:3])
+                    )
 
-                for i in range(len(tex_coords)):
-                    if tex_coord == tex_coords[i]:
-                        tex_coord_index = i
+            with open(filename, 'w', encoding='utf8') as model_file:
+                model_file.write('mtllib %s\n' % os.path.basename(materials_filename))
 
-                if tex_coord_index == -1:
-                    tex_coord_index = len(tex_coords)
-                    tex_coords.append(tex_coord)
+                write_lines(model_file, 'v %f %f %f\n', vertex_coords, (flipX, flipY, flipZ))
+                write_lines(model_file, 'vt %f %f\n', tex_coords, None)
+                write_lines(model_file, 'vn %f %f %f\n', normals, (flipX, flipY, flipZ))
 
-                # looking for normal
-                normal_index = -1
+                model_file.write('s off\n')
 
-                for i in range(len(normals)):
-                    if normal == normals[i]:
-                        normal_index = i
+                # write faces in runs of the same material
+                start = 0
 
-                if normal_index == -1:
-                    normal_index = len(normals)
-                    normals.append(normal)
+                for material_index, run in itertools.groupby(mesh.material_indices):
+                    count = sum(1 for _ in run)
 
-                for mat in materials:
-                    if mat == triangle.material:
-                        mat_name = mat.name
+                    model_file.write('usemtl %s\n' % names[material_index])
 
-                vertex_indices = [vertex_coord_index + 1, tex_coord_index + 1, 
-                                  normal_index + 1, mat_name]
+                    for first in range(start, start + count, WRITE_CHUNK_SIZE):
+                        last = min(first + WRITE_CHUNK_SIZE, start + count)
+                        model_file.write('f %d/%d/%d %d/%d/%d %d/%d/%d\n' * (last - first) % tuple(faces[stride * first:stride * last]))
 
-                face.append(vertex_indices)
+                    start += count
 
-            faces.append(face)
+        return True
 
-        # write vertex coordinates
-        model_file.write('mtllib %s\n' % materials_filename)
 
-        for v in vertex_coords:
-            model_file.write('v %f %f %f\n' % (flipX * v.x, flipY * v.y, flipZ * v.z))
+class ObjReader:
+    """Collects geometry of OBJ file before triangulation
 
-        for t in tex_coords:
-            model_file.write('vt %f %f\n' % (t.u, t.v))
+    Attribute fields are kept as strings by scan_text() and converted to
+    floats later at once. scan_bytes() converts them while scanning, so
+    memory does not depend on size of file text.
+    """
 
-        for n in normals:
-            model_file.write('vn %f %f %f\n' % (flipX * n.x, flipY * n.y, flipZ * n.z))
+    def __init__(self, filename: str, model: geometry.ArrayModel):
+        self.filename = filename
+        self.model = model
 
-        mat_name = ''
+        # numeric fields of vertex attributes
+        self.vertex_coords: list[str] | array = []
+        self.tex_coords: list[str] | array = []
+        self.normals: list[str] | array = []
 
-        model_file.write('s off\n')
+        # attribute indices of polygon corners, -1 means missing attribute
+        self.vertex_coord_indices = array('i')
+        self.tex_coord_indices = array('i')
+        self.normal_indices = array('i')
 
-        # write faces
-        for f in faces:
-            name = f[0][3]
+        self.polygon_sizes = array('i')
+        self.polygon_materials = array('i')
 
-            if name != mat_name:
-                model_file.write('usemtl %s\n' % name)
-                mat_name = name
+        self.materials: dict[str, geometry.Material] = {}
+        self.material_index = -1
 
-            model_file.write('f')
+    def counts(self) -> tuple[int, int, int]:
+        return len(self.vertex_coords) // 3, len(self.tex_coords) // 2, len(self.normals) // 3
 
-            if flipOrder:
-                model_file.write(' %d/%d/%d'
-                                 ' %d/%d/%d'
-                                 ' %d/%d/%d' 
-                                 % (*f[0], *f[2], *f[1]))
+    def add_face(self, corners: list, separator, counts: tuple[int, int, int]) -> None:
+        if self.material_index == -1:
+            self.material_index = self.model.add_material(geometry.Material())
 
-            else:
-                for v in f:
-                    model_file.write(' %d/%d/%d' % (*v[:3],))
+        polygon = [parse_face_vertex(corner, counts, separator) for corner in corners]
+
+        if len(polygon) < 3:
+            return
+
+        for vertex_coord, tex_coord, normal in polygon:
+            self.vertex_coord_indices.append(vertex_coord)
+            self.tex_coord_indices.append(tex_coord)
+            self.normal_indices.append(normal)
+
+        self.polygon_sizes.append(len(polygon))
+        self.polygon_materials.append(self.material_index)
+
+    def add_faces(self, texts: list[bytes]) -> bool:
+        """Adds polygons given by corner lists at once
+
+        Returns False when faces have to be added one by one instead, that is
+        when corners have different forms or relative indices.
+        """
+        sizes = array('i', map(len, map(bytes.split, texts)))
+
+        if min(sizes) < 3:
+            return False
+
+        text = b' '.join(texts)
+        first = texts[0].split(None, 1)[0]
+        layout = FACE_LAYOUTS.get((first.count(b'/'), first.count(b'//')))
+
+        if layout is None or layout[1].fullmatch(text) is None:
+            return False
+
+        slots, _ = layout
+        values = array('i', map(int, text.replace(b'/', b' ').split()))
+
+        if min(values) < 1:
+            return False
+
+        count = len(values) // len(slots)
+        columns = [array('i', [-1]) * count for _ in range(3)]
+
+        for i, slot in enumerate(slots):
+            columns[slot] = array('i', map((-1).__add__, values[i::len(slots)]))
 
-            model_file.write('\n')
+        if self.material_index == -1:
+            self.material_index = self.model.add_material(geometry.Material())
 
-        model_file.close()
-        materials_file.close()
+        self.vertex_coord_indices.extend(columns[0])
+        self.tex_coord_indices.extend(columns[1])
+        self.normal_indices.extend(columns[2])
+
+        self.polygon_sizes.extend(sizes)
+        self.polygon_materials.extend(array('i', [self.material_index]) * len(sizes))
 
         return True
 
+    def flush_faces(self, texts: list[bytes], counts: tuple[int, int, int]) -> bool:
+        # short runs of faces are faster to add one by one
+        if len(texts) >= BULK_FACE_COUNT and self.add_faces(texts):
+            texts.clear()
+            return True
+
+        for text in texts:
+            try:
+                self.add_face(text.split(), b'/', counts)
+            except ValueError:
+                print(f'Invalid face in file {self.filename}: f {text.decode("utf8", "replace")}')
+                return False
+
+        texts.clear()
+
+        return True
+
+    def use_material(self, name: str) -> None:
+        material = self.materials.get(name)
+
+        if material is None:
+            print(f'Unknown material {name} in file {self.filename}')
+            material = geometry.Material()
+
+        self.material_index = self.model.add_material(material)
+
+    def load_libraries(self, names: list[str]) -> None:
+        for name in names:
+            try:
+                self.materials.update(load_mtl_file(resolve_mtl_path(name, self.filename)))
+            except OSError:
+                print(f'Cannot read material library {name} used by file {self.filename}')
+
+    def scan_text(self) -> bool:
+        vertex_coords = self.vertex_coords
+        tex_coords = self.tex_coords
+        normals = self.normals
+
+        with open(self.filename, 'r', encoding='utf8') as input_file:
+            for lines in modelformats.iter_line_blocks(input_file):
+                for line in lines:
+                    parts = line.split()
+
+                    if len(parts) == 0:
+                        continue
+
+                    code = line_codes.get(parts[0])
+
+                    if code is None:
+                        continue
+                    elif code == LINE_V:
+                        vertex_coords.extend(parts[1:4])
+                    elif code == LINE_VT:
+                        # missing v coordinate is 0
+                        tex_coords.extend((parts[1:3] + ZERO_FIELDS)[:2])
+                    elif code == LINE_VN:
+                        normals.extend(parts[1:4])
+                    elif code == LINE_F:
+                        try:
+                            self.add_face(parts[1:], '/', self.counts())
+                        except ValueError:
+                            print(f'Invalid face in file {self.filename}: {line}')
+                            return False
+                    elif code == LINE_USEMTL:
+                        self.use_material(parts[1])
+                    elif code == LINE_MTLLIB:
+                        self.load_libraries(parts[1:])
+
+        return True
+
+    def scan_bytes(self) -> bool:
+        """Scans memory mapped file without decoding it into lines
+
+        Vertex attributes of every block are matched by regular expressions and
+        converted to floats at once. Faces and materials are processed in order.
+        """
+        self.vertex_coords = array('d')
+        self.tex_coords = array('d')
+        self.normals = array('d')
+
+        with open(self.filename, 'rb') as input_file:
+            size = os.fstat(input_file.fileno()).st_size
+
+            # empty file cannot be mapped
+            if size == 0:
+                return True
+
+            with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                start = 0
+
+                while start < size:
+                    end = buffer.find(b'\n', start + SCAN_BLOCK_SIZE)
+                    end = size if end == -1 else end + 1
+
+                    if not self.scan_block(buffer, start, end):
+                        return False
+
+                    start = end
+
+        return True
+
+    def scan_block(self, buffer: mmap.mmap, start: int, end: int) -> bool:
+        base_counts = self.counts()
+
+        # every line of block starts after newline
+        block = b'\n' + buffer[start:end]
+
+        for fields, pattern in ((self.vertex_coords, VERTEX_PATTERN), (self.normals, NORMAL_PATTERN)):
+            fields.extend(map(float, itertools.chain.from_iterable(pattern.findall(block))))
+
+        # missing v coordinate is matched as empty field and is 0
+        tex_coord_fields = itertools.chain.from_iterable(TEX_COORD_PATTERN.findall(block))
+        self.tex_coords.extend(float(field or 0) for field in tex_coord_fields)
+
+        counts = self.counts()
+
+        # faces with absolute indices are collected and added together
+        faces: list[bytes] = []
+
+        # positions of attribute lines, needed only for relative indices
+        attribute_positions = None
+
+        for match in ELEMENT_PATTERN.finditer(block):
+            keyword, text = match.groups()
+
+            if keyword == b'f' and b'-' not in text:
+                faces.append(text)
+
+                if len(faces) >= FACE_BATCH_SIZE and not self.flush_faces(faces, counts):
+                    return False
+
+                continue
+
+            if not self.flush_faces(faces, counts):
+                return False
+
+            if keyword == b'f':
+                if attribute_positions is None:
+                    attribute_positions = [[line.start() for line in pattern.finditer(block)]
+                                           for pattern in (VERTEX_PATTERN, TEX_COORD_PATTERN, NORMAL_PATTERN)]
+
+                position = match.start()
+                face_counts = tuple(base + bisect.bisect(positions, position)
+                                    for base, positions in zip(base_counts, attribute_positions))
+
+                try:
+                    self.add_face(text.split(), b'/', face_counts)
+                except ValueError:
+                    print(f'Invalid face in file {self.filename}: f {text.decode("utf8", "replace")}')
+                    return False
+            elif keyword == b'usemtl':
+                names = text.split()
+
+                if len(names) > 0:
+                    self.use_material(names[0].decode('utf8'))
+            else:
+                self.load_libraries([name.decode('utf8') for name in text.split()])
+
+        return self.flush_faces(faces, counts)
+
+
+# returns name of material library written next to OBJ file
+def get_materials_filename(filename: str) -> str:
+    if filename.find('.obj'):
+        return filename.replace('.obj', '.mtl')
+
+    return filename
+
+
+# parses face vertex in v, v/t, v//n or v/t/n form into 0-based indices,
+# negative indices are relative to number of attributes read so far,
+# text can be str or bytes with matching separator
+def parse_face_vertex(text: str | bytes, counts: tuple[int, int, int], separator: str | bytes = '/') -> tuple[int, int, int]:
+    elements = text.split(separator)
+
+    if len(elements) > 3 or not elements[0]:
+        raise ValueError(text)
+
+    result = [-1, -1, -1]
+
+    for i, element in enumerate(elements):
+        if not element:
+            continue
+
+        index = int(element)
+
+        if index > 0:
+            index -= 1
+        elif index < 0:
+            index += counts[i]
+
+        if index < 0:
+            raise ValueError(text)
+
+        result[i] = index
+
+    return tuple(result)
+
+
+# converts attribute fields to floats and gathers them for given indices into buffer,
+# each component is scaled by factor or, when factor is None, flipped as 1 - value
+def gather(buffer: array, fields: list[str] | array, indices: array, factors: tuple) -> None:
+    size = len(factors)
+
+    if isinstance(fields, array):
+        values = array(buffer.typecode, fields)
+    else:
+        values = array(buffer.typecode, map(float, fields))
+
+    count = len(values) // size
+
+    if len(indices) > 0 and max(indices) >= count:
+        raise IndexError(max(indices))
+
+    # element used for missing attributes
+    del values[count * size:]
+    values.extend([0.0] * size)
+
+    first = len(buffer)
+    buffer.extend(array(buffer.typecode, bytes(buffer.itemsize * size * len(indices))))
+
+    for component, factor in enumerate(factors):
+        column = values[component::size]
+
+        if factor is None:
+            column = array(buffer.typecode, map((1.0).__sub__, column))
+        elif factor != 1.0:
+            column = array(buffer.typecode, map(factor.__mul__, column))
+
+        column[-1] = 0.0
+
+        buffer[first + component::size] = array(buffer.typecode, map(column.__getitem__, indices))
+
 
 # state regex pattern
 state_pattern = re.compile(r'^.+(\[(.+?)\])$')
 
 
+# parsed material libraries: absolute path -> (mtime, materials)
+mtl_cache: dict[str, tuple[int, dict[str, geometry.Material]]] = {}
+
+
+# writes one line per element using template, components optionally multiplied by factors
+def write_lines(output_file, template: str, elements: list[tuple], factors: tuple | None) -> None:
+    if factors is not None and factors != (1.0,) * len(factors):
+        elements = [tuple(map(float.__mul__, factors, element)) for element in elements]
+
+    for first in range(0, len(elements), WRITE_CHUNK_SIZE):
+        chunk = elements[first:first + WRITE_CHUNK_SIZE]
+        output_file.write(template * len(chunk) % tuple(itertools.chain.from_iterable(chunk)))
+
+
+# returns absolute path of material library referenced by OBJ file
+def resolve_mtl_path(name: str, obj_filename: str) -> str:
+    path = os.path.join(os.path.dirname(obj_filename), name)
+
+    # files written by older versions refer to libraries relative to working directory
+    if not os.path.exists(path) and os.path.exists(name):
+        path = name
+
+    return os.path.abspath(path)
+
+
+# loads material library through cache, returns copies of its materials
+def load_mtl_file(filename: str) -> dict[str, geometry.Material]:
+    mtime = os.stat(filename).st_mtime_ns
+    entry = mtl_cache.get(filename)
+
+    if entry is None or entry[0] != mtime:
+        entry = (mtime, read_mtl_file(filename))
+        mtl_cache[filename] = entry
+
+    return {name: copy.deepcopy(material) for name, material in entry[1].items()}
+
+
 # reads Wavefront .MTL material file
-def read_mtl_file(filename: str) -> list[geometry.Material]:
-    materials: list[geometry.Material] = {}
+def read_mtl_file(filename: str) -> dict[str, geometry.Material]:
+    materials: dict[str, geometry.Material] = {}
 
     input_file = open(filename, 'r', encoding='utf8')
 
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# Implements pipelined batch conversion in one process
+#
+# Prefetch thread reads upcoming input files ahead, so parsing finds them in
+# page cache instead of waiting for disk or network. Main thread parses inputs
+# and writer thread writes finished models. Queues between stages are bounded,
+# so only a few models are kept in memory at once.
+
+import io
+import queue
+import sys
+import threading
+
+import modelformats
+
+# number of input files read ahead of parsing
+PREFETCH_FILES = 4
+
+# number of parsed models waiting for writer
+WRITE_QUEUE_SIZE = 2
+
+# size of block read by prefetch thread
+PREFETCH_BLOCK_SIZE = 1 << 20
+
+
+class ThreadOutput:
+    """Standard output which sends text of each thread to its own log
+
+    Threads without log write to original output.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.local = threading.local()
+
+    def set_log(self, log: io.StringIO | None) -> None:
+        self.local.log = log
+
+    def write(self, text: str) -> int:
+        log = getattr(self.local, 'log', None)
+
+        if log is None:
+            return self.output.write(text)
+
+        return log.write(text)
+
+    def flush(self) -> None:
+        self.output.flush()
+
+
+# reads input files ahead of parsing, puts index of every job when it is read
+def prefetch(jobs: list[tuple], prefetched: queue.Queue) -> None:
+    for index, (in_format, in_filename, in_params, outputs) in enumerate(jobs):
+        try:
+            with open(in_filename, 'rb', buffering=0) as input_file:
+                while input_file.read(PREFETCH_BLOCK_SIZE):
+                    pass
+        except OSError:
+            # errors are reported when file is parsed
+            pass
+
+        prefetched.put(index)
+
+
+# writes parsed models in order, puts success flag and log of every job
+def write_models(output: ThreadOutput, parsed: queue.Queue, finished: queue.Queue) -> None:
+    while True:
+        item = parsed.get()
+
+        if item is None:
+            break
+
+        (in_format, in_filename, in_params, outputs), model, results, log = item
+
+        output.set_log(log)
+
+        try:
+            # outputs are written one by one, so their messages go to log of this thread in order
+            if model is not None:
+                results = modelformats.write_outputs(model, outputs, False)
+        except Exception as e:
+            print(f'Error: {type(e).__name__}: {e}')
+            results = [False]
+
+        completed = modelformats.print_results(in_filename, outputs, results)
+
+        output.set_log(None)
+        finished.put((completed, log.getvalue()))
+
+
+# converts files with prefetch, parse and write stages running at once,
+# yields success flag and console output of every job in order
+def convert_pipelined(jobs: list[tuple]):
+    prefetched: queue.Queue = queue.Queue(PREFETCH_FILES)
+    parsed: queue.Queue = queue.Queue(WRITE_QUEUE_SIZE)
+    finished: queue.Queue = queue.Queue()
+
+    output = ThreadOutput(sys.stdout)
+
+    prefetcher = threading.Thread(target=prefetch, args=(jobs, prefetched), daemon=True)
+    writer = threading.Thread(target=write_models, args=(output, parsed, finished), daemon=True)
+
+    sys.stdout = output
+    prefetcher.start()
+    writer.start()
+
+    yielded = 0
+
+    try:
+        for job in jobs:
+            prefetched.get()
+
+            in_format, in_filename, in_params, outputs = job
+            model = None
+            results = None
+            log = io.StringIO()
+
+            output.set_log(log)
+
+            try:
+                transcoder = modelformats.get_transcoder(in_format, in_filename, in_params, outputs)
+
+                # direct conversion reads and writes at once, its result goes through writer only to keep order
+                if transcoder is not None:
+                    results = [modelformats.run_transcoder(transcoder, in_filename, in_params, outputs[0])]
+                else:
+                    model = modelformats.new_model(in_format, in_filename)
+
+                    if not modelformats.read(in_format, in_filename, model, in_params):
+                        model = None
+                        results = [False] * len(outputs)
+            except Exception as e:
+                print(f'Error: {type(e).__name__}: {e}')
+                model = None
+                results = [False]
+
+            output.set_log(None)
+
+            # blocks while writer is behind, so parsed models do not pile up
+            parsed.put((job, model, results, log))
+            del model
+
+            while not finished.empty():
+                yield finished.get()
+                yielded += 1
+
+        parsed.put(None)
+
+        while yielded < len(jobs):
+            yield finished.get()
+            yielded += 1
+
+        writer.join()
+    finally:
+        sys.stdout = output.output
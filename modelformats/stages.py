@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Implements optional processing stages run on model before it is written
+#
+# Stages are enabled by output parameters common to all formats. They work
+# on copy of model, so other outputs of the same input get original model.
+
+import itertools
+from array import array
+
+import geometry
+import profiling
+
+# output parameters handled by stages instead of formats
+STAGE_PARAMS = ('sort', 'vcache')
+
+
+# runs stages enabled in params, returns None on invalid parameter
+def apply_stages(filename: str, model: geometry.ArrayModel, params: dict[str, str]) -> geometry.ArrayModel | None:
+    # grouping makes runs of one material, which vertex cache optimization keeps
+    if 'sort' in params:
+        model = group_materials(filename, model, params['sort'])
+
+    if model is not None and 'vcache' in params:
+        model = reorder_vertex_cache(filename, model, params['vcache'])
+
+    return model
+
+
+# sorts triangles by render state of their materials
+def group_materials(filename: str, model: geometry.ArrayModel, value: str) -> geometry.ArrayModel | None:
+    if value not in ('none', 'transparent'):
+        print(f'Invalid sort mode: {value}')
+        return None
+
+    with profiling.span('stage.sort'):
+        order = geometry.group_triangles(model.materials, model.material_indices, value == 'transparent')
+        result = model.select(order)
+
+        before = geometry.count_state_changes(model.materials, model.material_indices)
+        after = geometry.count_state_changes(result.materials, result.material_indices)
+
+        print(f'{filename}: state changes {before} -> {after}')
+
+        return result
+
+
+# reorders triangles within runs of one material for post-transform vertex cache
+def reorder_vertex_cache(filename: str, model: geometry.ArrayModel, value: str) -> geometry.ArrayModel | None:
+    cache_size = geometry.vertexcache.CACHE_SIZE
+
+    if value != 'none':
+        try:
+            cache_size = int(value)
+        except ValueError:
+            cache_size = 0
+
+        if cache_size <= 3:
+            print(f'Invalid vertex cache size: {value}')
+            return None
+
+    with profiling.span('stage.vcache'):
+        mesh = geometry.IndexedMesh.from_arrays(model)
+        order = array('i')
+        start = 0
+
+        for _, run in itertools.groupby(model.material_indices):
+            count = sum(1 for _ in run)
+            run_order = geometry.optimize_vertex_cache(mesh.indices[3 * start:3 * (start + count)], cache_size)
+
+            order.extend(map(start.__add__, run_order))
+            start += count
+
+        indices = array('i', bytes(mesh.indices.itemsize * len(mesh.indices)))
+
+        for corner in range(3):
+            indices[corner::3] = array('i', map(mesh.indices[corner::3].__getitem__, order))
+
+        before = geometry.cache_miss_ratio(mesh.indices, cache_size)
+        after = geometry.cache_miss_ratio(indices, cache_size)
+
+        print(f'{filename}: ACMR {before:.3f} -> {after:.3f}')
+
+        return model.select(order)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Implements direct conversions between Colobot formats
+#
+# Triangles are converted chunk by chunk from records of one format to
+# records of the other, without building model of the whole file.
+
+from array import array
+
+import profiling
+from modelformats import get_param, register_transcoder
+from modelformats.colobot import TRIANGLE_ARGS, CHUNK_SIZE, triangle_template, format_material, iter_triangle_chunks, make_material
+from modelformats.colobotold import HEADER, RECORD, RECORD_MATERIAL, RECORD_MATERIAL_TAIL, RECORD_FLOATS, VERTEX_OFFSET, decode_material, encode_material
+
+# numeric vertex fields of triangle, stored in the same order by both formats
+TRIANGLE_FIELDS = 30
+
+
+# converts old binary model to new text model
+def old_to_new_txt(in_filename: str, in_params: dict[str, str], out_filename: str, out_params: dict[str, str]) -> bool:
+    version = int(get_param(out_params, 'version', '2'))
+    dirt = 'Y' if 'dirt' in out_params else 'N'
+
+    with open(in_filename, 'rb') as input_file:
+        data = input_file.read(HEADER.size)
+
+        if len(data) < HEADER.size:
+            print(f'File {in_filename} is too short')
+            return False
+
+        version_major, version_minor, triangle_count = HEADER.unpack(data)
+
+        if version_major != 1 or version_minor != 2:
+            print(f'Unsupported format version: {version_major}.{version_minor}')
+            return False
+
+        # material lines, formatted once per distinct record
+        material_lines: dict[tuple, str] = {}
+
+        with open(out_filename, 'w', encoding='utf8', buffering=CHUNK_SIZE * 1024) as output_file:
+            output_file.write('# Colobot text model\n'
+                              '\n'
+                              '### HEAD\n'
+                              'version %s\n'
+                              'total_triangles %d\n'
+                              '\n'
+                              '### TRIANGLES\n'
+                              % (version, triangle_count))
+
+            for first in range(0, triangle_count, CHUNK_SIZE):
+                count = min(CHUNK_SIZE, triangle_count - first)
+
+                with profiling.span('transcode.read'):
+                    records = input_file.read(count * RECORD.size)
+
+                if len(records) < count * RECORD.size:
+                    print(f'File {in_filename} is truncated')
+                    return False
+
+                with profiling.span('transcode.convert'):
+                    floats = array('f')
+                    floats.frombytes(records)
+
+                    args = [None] * (TRIANGLE_ARGS * count)
+
+                    for field in range(TRIANGLE_FIELDS):
+                        args[field::TRIANGLE_ARGS] = floats[VERTEX_OFFSET + field::RECORD_FLOATS]
+
+                    lines = []
+
+                    for values in RECORD_MATERIAL.iter_unpack(records):
+                        line = material_lines.get(values)
+
+                        if line is None:
+                            line = format_material(decode_material(values), dirt, version)
+                            material_lines[values] = line
+
+                        lines.append(line)
+
+                    args[TRIANGLE_FIELDS::TRIANGLE_ARGS] = lines
+
+                    text = (triangle_template * count) % tuple(args)
+
+                with profiling.span('transcode.write'):
+                    output_file.write(text)
+
+    return True
+
+
+# converts new text model to old binary model
+def new_txt_to_old(in_filename: str, in_params: dict[str, str], out_filename: str, out_params: dict[str, str]) -> bool:
+    dirt = int(get_param(out_params, 'dirt', '0'))
+
+    # material part of record, packed once per distinct material lines
+    tails: dict[tuple, bytes] = {}
+    triangle_count = 0
+
+    with open(in_filename, 'r', encoding='utf8') as input_file, open(out_filename, 'wb') as output_file:
+        # triangle count is written when known
+        output_file.write(bytes(HEADER.size))
+
+        for tokens, keys in iter_triangle_chunks(input_file, {}):
+            count = len(keys)
+
+            with profiling.span('transcode.convert'):
+                output = bytearray(count * RECORD.size)
+
+                records = memoryview(output)
+                records.cast('i')[0::RECORD_FLOATS] = array('i', [1]) * count
+
+                fields = array('f', map(float, tokens))
+                floats = records.cast('f')
+
+                for field in range(TRIANGLE_FIELDS):
+                    floats[VERTEX_OFFSET + field::RECORD_FLOATS] = fields[field::TRIANGLE_FIELDS]
+
+                start = RECORD.size - RECORD_MATERIAL_TAIL.size
+
+                for key in keys:
+                    tail = tails.get(key)
+
+                    if tail is None:
+                        tail = encode_material(make_material(*key), dirt)
+                        tails[key] = tail
+
+                    output[start:start + RECORD_MATERIAL_TAIL.size] = tail
+                    start += RECORD.size
+
+            with profiling.span('transcode.write'):
+                output_file.write(output)
+
+            triangle_count += count
+
+        output_file.seek(0)
+        output_file.write(HEADER.pack(1, 2, triangle_count))
+
+    return True
+
+
+register_transcoder('old', 'new_txt', old_to_new_txt, out_params=('version', 'dirt'))
+register_transcoder('new_txt', 'old', new_txt_to_old, out_params=('dirt',))
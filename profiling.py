@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Implements timing spans and counters for profiling conversions
+#
+# Spans are named by phase, e.g. 'read', 'read.old.vertices'. When profiling
+# is disabled span() returns shared object that does nothing.
+
+import json
+import threading
+import time
+
+enabled = False
+start_time = 0.0
+
+# span name -> [total time, number of calls]
+spans: dict[str, list] = {}
+counters: dict[str, int] = {}
+
+# totals can be updated from several threads at once
+lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+
+        with lock:
+            entry = spans.get(self.name)
+
+            if entry is None:
+                entry = [0.0, 0]
+                spans[self.name] = entry
+
+            entry[0] += elapsed
+            entry[1] += 1
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+
+NULL_SPAN = NullSpan()
+
+
+def enable() -> None:
+    global enabled
+    enabled = True
+    reset()
+
+
+def reset() -> None:
+    global start_time
+    start_time = time.perf_counter()
+    spans.clear()
+    counters.clear()
+
+
+# returns timing span context manager
+def span(name: str) -> Span | NullSpan:
+    if enabled:
+        return Span(name)
+
+    return NULL_SPAN
+
+
+def count(name: str, value: int = 1) -> None:
+    if enabled:
+        with lock:
+            counters[name] = counters.get(name, 0) + value
+
+
+def report() -> dict:
+    return {
+        'total': time.perf_counter() - start_time,
+        'spans': {name: {'time': entry[0], 'calls': entry[1]} for name, entry in sorted(spans.items())},
+        'counters': dict(sorted(counters.items())),
+    }
+
+
+def save_report(filename: str) -> None:
+    with open(filename, 'w', encoding='utf8') as output_file:
+        json.dump(report(), output_file, indent=1)
+
+
+def print_report() -> None:
+    total = time.perf_counter() - start_time
+
+    print('Phase                                 Time       Share  Calls')
+
+    for name, entry in sorted(spans.items()):
+        label = '  ' * name.count('.') + name
+        share = 100.0 * entry[0] / total if total > 0 else 0.0
+
+        print('{:<32}{:>10.4f} s{:>8.1f}%{:>7}'.format(label, entry[0], share, entry[1]))
+
+    print('{:<32}{:>10.4f} s'.format('total', total))
+
+    if len(counters) > 0:
+        print()
+
+        for name, value in sorted(counters.items()):
+            print('{:<32}{:>12}'.format(name, value))
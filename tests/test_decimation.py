@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Tests level of detail generation
+
+import os
+import sys
+import unittest
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geometry
+
+
+# adds flat grid of width x height quads, two triangles each, with material of given level
+def add_grid(model: geometry.ArrayModel, width: int, height: int, lod: int) -> None:
+    material = geometry.Material()
+    material.lod = lod
+    index = model.add_material(material)
+
+    for x in range(width):
+        for y in range(height):
+            for corners in (((0, 0), (1, 0), (1, 1)), ((0, 0), (1, 1), (0, 1))):
+                for dx, dy in corners:
+                    model.positions.extend(((x + dx) / width, (y + dy) / height, 0.0))
+                    model.normals.extend((0.0, 0.0, 1.0))
+                    model.tex1.extend(((x + dx) / width, (y + dy) / height))
+                    model.tex2.extend((0.0, 0.0))
+
+                model.material_indices.append(index)
+
+
+# returns number of triangles of every level
+def count_levels(model: geometry.ArrayModel) -> Counter:
+    return Counter(model.materials[index].lod for index in model.material_indices)
+
+
+class GenerateLodsTest(unittest.TestCase):
+    def test_levels_from_plain_model(self):
+        model = geometry.ArrayModel('d')
+        add_grid(model, 40, 40, 0)
+
+        levels = count_levels(geometry.generate_lods(model))
+
+        self.assertEqual(levels[geometry.LOD_HIGH], 3200)
+        self.assertLessEqual(levels[geometry.LOD_MEDIUM], 1600)
+        self.assertLessEqual(levels[geometry.LOD_LOW], 800)
+
+    def test_existing_levels_are_replaced(self):
+        model = geometry.ArrayModel('d')
+        add_grid(model, 40, 40, geometry.LOD_HIGH)
+        add_grid(model, 40, 20, geometry.LOD_MEDIUM)
+        add_grid(model, 20, 20, geometry.LOD_LOW)
+
+        levels = count_levels(geometry.generate_lods(model))
+
+        # high level keeps only its own triangles, lower levels are made from it
+        self.assertEqual(levels[geometry.LOD_HIGH], 3200)
+        self.assertGreater(levels[geometry.LOD_MEDIUM], 0)
+        self.assertLessEqual(levels[geometry.LOD_MEDIUM], 1600)
+        self.assertGreater(levels[geometry.LOD_LOW], 0)
+        self.assertLessEqual(levels[geometry.LOD_LOW], 800)
+        self.assertEqual(set(levels), {geometry.LOD_HIGH, geometry.LOD_MEDIUM, geometry.LOD_LOW})
+
+
+if __name__ == '__main__':
+    unittest.main()